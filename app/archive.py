@@ -0,0 +1,157 @@
+"""
+Archivo de turnos terminados y sus reservas.
+
+Los turnos cuyo fin (fecha_hora_inicio + duracion_minutos) ya pasó se
+mueven, junto con sus reservas, a turnos_historicos y reservas_historicas,
+así los chequeos de capacidad y los listados trabajan sobre tablas chicas.
+Sus listas de espera se descartan.
+
+Se mueve de a lotes de `ARCHIVO_LOTE` turnos, cada uno en su propia
+transacción corta, para no retener el lock de escritura de SQLite mientras
+los handlers reservan. El lote arranca con el INSERT ... SELECT, así dos
+procesos corriendo el archivo a la vez nunca mueven el mismo turno. Los ids
+se conservan (turnos y reservas son AUTOINCREMENT y no los reutilizan) y
+las estadísticas no cambian: sus triggers ignoran los borrados de filas
+que ya están en el archivo.
+
+Correr una vez: python -m app.archive [--dias N] [--lote N]
+Dentro de la API: ARCHIVO_INTERVALO=<segundos> lo corre periódicamente.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection
+from starlette.concurrency import run_in_threadpool
+
+from app import cache, database, models
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre corridas dentro de la API; 0 la desactiva
+INTERVALO = float(os.getenv("ARCHIVO_INTERVALO", 0))
+# Turnos movidos por transacción
+LOTE = int(os.getenv("ARCHIVO_LOTE", 500))
+# Pausa entre lotes, para dejar pasar a las escrituras de la API
+PAUSA = float(os.getenv("ARCHIVO_PAUSA", 0.05))
+# Días que un turno terminado sigue en las tablas activas
+DIAS = int(os.getenv("ARCHIVO_DIAS", 0))
+
+
+def _columnas(modelo) -> list:
+    return [columna.name for columna in modelo.__table__.columns]
+
+
+def _fin(turno=models.Turno):
+    # Mismo formato que devuelve datetime() de SQLite
+    return func.datetime(
+        turno.fecha_hora_inicio, func.printf("+%d minutes", turno.duracion_minutos)
+    )
+
+
+def archivar_lote(conn: Connection, limite: datetime, lote: int) -> dict:
+    """
+    Mover hasta `lote` turnos terminados antes de `limite`, con sus reservas.
+    No hace commit.
+    """
+    turno, reserva = models.Turno, models.Reserva
+    columnas_turno = _columnas(models.TurnoHistorico)
+    terminados = (
+        select(*(getattr(turno, c) for c in columnas_turno))
+        # El primer filtro usa el índice de fecha; el segundo es el exacto
+        .where(
+            turno.fecha_hora_inicio < limite,
+            _fin() < limite.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        .order_by(turno.fecha_hora_inicio)
+        .limit(lote)
+    )
+    movidos = conn.execute(
+        insert(models.TurnoHistorico)
+        .from_select(columnas_turno, terminados)
+        .returning(models.TurnoHistorico.id, models.TurnoHistorico.servicio_id)
+    ).all()
+    if not movidos:
+        return {"turnos": 0, "reservas": 0, "servicios": set()}
+
+    ids = [fila.id for fila in movidos]
+    columnas_reserva = _columnas(models.ReservaHistorica)
+    reservas = conn.execute(
+        insert(models.ReservaHistorica).from_select(
+            columnas_reserva,
+            select(*(getattr(reserva, c) for c in columnas_reserva)).where(
+                reserva.turno_id.in_(ids)
+            ),
+        )
+    ).rowcount
+    conn.execute(delete(models.Espera).where(models.Espera.turno_id.in_(ids)))
+    conn.execute(delete(reserva).where(reserva.turno_id.in_(ids)))
+    conn.execute(delete(turno).where(turno.id.in_(ids)))
+    return {
+        "turnos": len(ids),
+        "reservas": reservas,
+        "servicios": {fila.servicio_id for fila in movidos},
+    }
+
+
+def archivar(
+    engine=database.engine,
+    dias: int = DIAS,
+    lote: int = LOTE,
+    pausa: float = PAUSA,
+    ahora: Optional[datetime] = None,
+) -> dict:
+    """
+    Mover todos los turnos terminados hace más de `dias` días, de a lotes.
+    Devuelve los totales movidos y los servicios afectados.
+    """
+    limite = (ahora or datetime.utcnow()) - timedelta(days=dias)
+    total = {"turnos": 0, "reservas": 0, "servicios": set()}
+    while True:
+        with engine.begin() as conn:
+            resultado = archivar_lote(conn, limite, lote)
+        total["turnos"] += resultado["turnos"]
+        total["reservas"] += resultado["reservas"]
+        total["servicios"] |= resultado["servicios"]
+        if resultado["turnos"] < lote:
+            return total
+        time.sleep(pausa)
+
+
+def _invalidar(servicios: Set[int]) -> None:
+    cache.catalogo.invalidar(*(f"turnos_servicio:{s}" for s in servicios))
+
+
+async def periodicamente(intervalo: float = INTERVALO) -> None:
+    """
+    Correr el archivo cada `intervalo` segundos, en el threadpool.
+    Para usar como tarea de fondo en el lifespan de la API.
+    """
+    while True:
+        try:
+            resultado = await run_in_threadpool(archivar)
+        except Exception:
+            # Se reintenta en la próxima corrida
+            logger.exception("Error archivando turnos")
+        else:
+            if resultado["servicios"]:
+                _invalidar(resultado["servicios"])
+        await asyncio.sleep(intervalo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dias", type=int, default=DIAS)
+    parser.add_argument("--lote", type=int, default=LOTE)
+    parser.add_argument("--pausa", type=float, default=PAUSA)
+    args = parser.parse_args()
+
+    resultado = archivar(dias=args.dias, lote=args.lote, pausa=args.pausa)
+    print(
+        f"Archivados {resultado['turnos']} turnos y {resultado['reservas']} reservas"
+    )
@@ -0,0 +1,236 @@
+"""
+Verificación de JWT con cache y revocaciones persistidas en SQLite.
+
+El backend de fastapi_auth_jwt verifica la firma en cada request y guarda
+los tokens emitidos en un dict del proceso: un reinicio desloguea a todos
+y un token emitido por un worker no vale en otro. Acá un token vale si la
+firma y el vencimiento son correctos, el usuario existe y no fue revocado.
+El logout se registra en la tabla tokens_revocados y la revocación de todos
+los tokens de un usuario (al eliminarlo o cambiarle el rol) en
+revocaciones_usuario, ambas compartidas por todos los workers.
+
+- Los tokens verificados se guardan en un LRU acotado, con clave el
+  digest del token y vencimiento igual al `exp` del token.
+- Al verificar un token que no está en el LRU se consulta la base: el
+  usuario tiene que existir y sus tokens no pueden estar revocados desde
+  después del `iat`.
+- Cada worker mantiene en memoria las revocaciones vigentes y cada
+  `revocaciones_refresco` segundos lee solo las filas nuevas (por id).
+- Las revocaciones vencidas se borran de la tabla y de memoria.
+"""
+import hashlib
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import jwt
+from pydantic import BaseModel
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from starlette.concurrency import run_in_threadpool
+from fastapi_auth_jwt import JWTAuthBackend
+
+from app import database, models
+from app.config import TokenSettings
+
+# Cada cuántos segundos se borran de la tabla las revocaciones vencidas
+PODA_SEGUNDOS = 300
+
+
+def digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class BackendJWT(JWTAuthBackend):
+    def __init__(self, *args, token_settings: Optional[TokenSettings] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token_settings = token_settings or TokenSettings()
+        # digest -> (usuario, exp, iat)
+        self._verificados: "OrderedDict[str, Tuple[BaseModel, float, float]]" = OrderedDict()
+        # digest -> exp de los tokens revocados todavía vigentes
+        self._revocados: Dict[str, float] = {}
+        # username -> los tokens emitidos antes de esto están revocados
+        self._revocados_usuario: Dict[str, float] = {}
+        self._ultima_revocacion = 0
+        self._ultima_revocacion_usuario = 0
+        self._proxima_sincronizacion = 0.0
+        self._proxima_poda = 0.0
+
+    async def create_token(
+        self,
+        user_data: Union[Dict[str, Any], BaseModel],
+        expiration: Optional[Union[int, float, timedelta]] = None,
+    ) -> str:
+        if isinstance(user_data, BaseModel):
+            payload = user_data.model_dump(exclude_none=True)
+        else:
+            payload = dict(user_data)
+        # Dos logins en el mismo segundo no deben compartir token (ni revocación)
+        payload["jti"] = secrets.token_hex(8)
+        # Con fracción de segundo: un login justo después de una revocación vale
+        payload["iat"] = time.time()
+        if expiration is None:
+            expiration = self.config.expiration_seconds
+        elif isinstance(expiration, timedelta):
+            expiration = expiration.total_seconds()
+        return self.jwt_handler.encode(payload=payload, expiration=expiration)
+
+    async def get_current_user(self, token: str) -> Optional[BaseModel]:
+        await self._sincronizar()
+        clave = digest(token)
+        if clave in self._revocados:
+            raise jwt.InvalidTokenError("Token revocado")
+
+        entrada = self._verificados.get(clave)
+        if entrada is not None and entrada[1] > time.time():
+            usuario, _, iat = entrada
+            if iat < self._revocados_usuario.get(usuario.username, 0):
+                del self._verificados[clave]
+                raise jwt.InvalidTokenError("Token revocado")
+            self._verificados.move_to_end(clave)
+            return usuario
+
+        payload = self._decodificar(token)
+        exp = payload.pop("exp")
+        iat = payload.pop("iat")
+        payload.pop("jti", None)
+        username = payload.get("username")
+        existe, desde = await run_in_threadpool(_leer_usuario, username)
+        if not existe:
+            return None
+        if desde is not None:
+            desde = _epoch(desde)
+            if desde > self._revocados_usuario.get(username, 0):
+                self._revocados_usuario[username] = desde
+        if iat < self._revocados_usuario.get(username, 0):
+            raise jwt.InvalidTokenError("Token revocado")
+        usuario = self.user_schema.model_construct(token=token, **payload)
+        self._verificados[clave] = (usuario, exp, iat)
+        while len(self._verificados) > self.token_settings.cache_maxsize:
+            self._verificados.popitem(last=False)
+        return usuario
+
+    async def invalidate_token(self, token: str) -> None:
+        exp = self._decodificar(token)["exp"]
+        clave = digest(token)
+        await run_in_threadpool(_guardar_revocacion, clave, datetime.utcfromtimestamp(exp))
+        self._revocados[clave] = exp
+        self._verificados.pop(clave, None)
+
+    def revocar_usuario(self, username: str) -> None:
+        """
+        Revocar todos los tokens emitidos hasta ahora para `username`.
+        Es sync: la llaman los handlers sync de usuarios, desde el threadpool.
+        """
+        desde = datetime.utcnow()
+        vencimiento = timedelta(seconds=self.config.expiration_seconds)
+        _guardar_revocacion_usuario(username, desde, desde + vencimiento)
+        self._revocados_usuario[username] = _epoch(desde)
+
+    def _decodificar(self, token: str) -> dict:
+        # Verifica firma y vencimiento; a diferencia de JWTHandler.decode conserva `exp`
+        return jwt.decode(
+            token,
+            self.config.secret,
+            algorithms=[self.config.jwt_algorithm],
+            options={"require": ["exp", "iat"]},
+        )
+
+    async def _sincronizar(self) -> None:
+        """
+        Traer las revocaciones de otros workers y olvidar las vencidas.
+        """
+        ahora = time.time()
+        if ahora < self._proxima_sincronizacion:
+            return
+        self._proxima_sincronizacion = ahora + self.token_settings.revocaciones_refresco
+        podar = ahora >= self._proxima_poda
+        if podar:
+            self._proxima_poda = ahora + PODA_SEGUNDOS
+
+        nuevas, nuevas_usuario = await run_in_threadpool(
+            _leer_revocaciones, self._ultima_revocacion, self._ultima_revocacion_usuario, podar
+        )
+        for id_, clave, expira in nuevas:
+            self._ultima_revocacion = max(self._ultima_revocacion, id_)
+            self._revocados[clave] = _epoch(expira)
+            self._verificados.pop(clave, None)
+        for id_, username, desde in nuevas_usuario:
+            self._ultima_revocacion_usuario = max(self._ultima_revocacion_usuario, id_)
+            desde = _epoch(desde)
+            if desde > self._revocados_usuario.get(username, 0):
+                self._revocados_usuario[username] = desde
+        for clave in [clave for clave, exp in self._revocados.items() if exp <= ahora]:
+            del self._revocados[clave]
+        # Pasado el vencimiento, todo token emitido antes de `desde` ya venció
+        vencidos = ahora - self.config.expiration_seconds
+        for username in [u for u, desde in self._revocados_usuario.items() if desde <= vencidos]:
+            del self._revocados_usuario[username]
+
+
+def _epoch(fecha: datetime) -> float:
+    return (fecha - datetime(1970, 1, 1)).total_seconds()
+
+
+# --- Acceso a la tabla, desde el threadpool ---
+def _guardar_revocacion(clave: str, expira: datetime) -> None:
+    with database.engine.begin() as conn:
+        conn.execute(
+            sqlite_insert(models.TokenRevocado)
+            .values(digest=clave, expira=expira)
+            .on_conflict_do_nothing(index_elements=["digest"])
+        )
+
+
+def _guardar_revocacion_usuario(username: str, desde: datetime, expira: datetime) -> None:
+    with database.engine.begin() as conn:
+        conn.execute(
+            insert(models.RevocacionUsuario).values(
+                username=username, desde=desde, expira=expira
+            )
+        )
+
+
+def _leer_revocaciones(
+    desde_id: int, desde_id_usuario: int, podar: bool
+) -> Tuple[List[Tuple[int, str, datetime]], List[Tuple[int, str, datetime]]]:
+    tabla = models.TokenRevocado
+    usuarios = models.RevocacionUsuario
+    with database.engine.begin() as conn:
+        if podar:
+            conn.execute(delete(tabla).where(tabla.expira <= datetime.utcnow()))
+            conn.execute(delete(usuarios).where(usuarios.expira <= datetime.utcnow()))
+        filas = conn.execute(
+            select(tabla.id, tabla.digest, tabla.expira)
+            .where(tabla.id > desde_id, tabla.expira > datetime.utcnow())
+            .order_by(tabla.id)
+        ).all()
+        filas_usuario = conn.execute(
+            select(usuarios.id, usuarios.username, usuarios.desde)
+            .where(usuarios.id > desde_id_usuario, usuarios.expira > datetime.utcnow())
+            .order_by(usuarios.id)
+        ).all()
+    return [tuple(fila) for fila in filas], [tuple(fila) for fila in filas_usuario]
+
+
+def _leer_usuario(username: Optional[str]) -> Tuple[bool, Optional[datetime]]:
+    """
+    Si el usuario existe y desde cuándo están revocados sus tokens, en una query.
+    """
+    usuarios = models.RevocacionUsuario
+    revocado_desde = (
+        select(func.max(usuarios.desde))
+        .where(usuarios.username == username)
+        .scalar_subquery()
+    )
+    with database.engine.connect() as conn:
+        fila = conn.execute(
+            select(models.Usuario.id, revocado_desde).where(
+                models.Usuario.username == username
+            )
+        ).first()
+    if fila is None:
+        return False, None
+    return True, fila[1]
@@ -0,0 +1,164 @@
+"""
+Cache en memoria de las respuestas del catálogo (servicios y emprendedores).
+
+Cada entrada guarda el JSON ya serializado, con una clave armada a partir
+de la ruta y los query params, y un conjunto de etiquetas (p.ej.
+"servicio:3"). Los handlers que modifican datos invalidan solo las
+etiquetas afectadas después del commit.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import Request, Response
+
+from app import render
+
+
+@dataclass
+class _Entrada:
+    contenido: bytes
+    headers: Dict[str, str]
+    etiquetas: Set[str]
+    vence: float
+
+
+@dataclass
+class Consulta:
+    """
+    Resultado de buscar una clave: la respuesta cacheada si hubo hit, o lo
+    necesario para guardar la respuesta calculada si hubo miss.
+    """
+
+    cache: "CacheRespuestas"
+    clave: str
+    generacion: int
+    respuesta: Optional[Response] = field(default=None)
+
+    def guardar(
+        self,
+        modelo,
+        datos,
+        etiquetas: Iterable[str],
+        response: Optional[Response] = None,
+    ) -> Response:
+        """
+        Serializar `datos` con el `response_model` del endpoint, guardar el
+        resultado y devolverlo como Response.
+        """
+        contenido = render.json_bytes(modelo, datos)
+        headers = dict(response.headers) if response is not None else {}
+        headers.pop("content-length", None)
+        self.cache.set(self.clave, contenido, headers, set(etiquetas), self.generacion)
+        return Response(contenido, media_type="application/json", headers=headers)
+
+
+class CacheRespuestas:
+    """
+    LRU acotado por cantidad de entradas y con vencimiento por TTL.
+    Seguro para usar desde el threadpool de FastAPI.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entradas: "OrderedDict[str, _Entrada]" = OrderedDict()
+        self._por_etiqueta: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación; una respuesta calculada antes
+        # de una invalidación no se guarda, porque puede estar desactualizada.
+        self._generacion = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidaciones = 0
+
+    @staticmethod
+    def clave(request: Request) -> str:
+        params = sorted(request.query_params.multi_items())
+        return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in params)
+
+    def consultar(self, request: Request) -> Consulta:
+        clave = self.clave(request)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.vence < time.monotonic():
+                self._quitar(clave)
+                entrada = None
+            if entrada is None:
+                self.misses += 1
+                return Consulta(self, clave, self._generacion)
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+        respuesta = Response(
+            entrada.contenido, media_type="application/json", headers=entrada.headers
+        )
+        return Consulta(self, clave, self._generacion, respuesta)
+
+    def set(
+        self,
+        clave: str,
+        contenido: bytes,
+        headers: Dict[str, str],
+        etiquetas: Set[str],
+        generacion: int,
+    ) -> None:
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = _Entrada(
+                contenido, headers, etiquetas, time.monotonic() + self.ttl
+            )
+            for etiqueta in etiquetas:
+                self._por_etiqueta.setdefault(etiqueta, set()).add(clave)
+            while len(self._entradas) > self.maxsize:
+                self._quitar(next(iter(self._entradas)))
+                self.evictions += 1
+
+    def invalidar(self, *etiquetas: str) -> None:
+        with self._lock:
+            self._generacion += 1
+            for etiqueta in etiquetas:
+                for clave in self._por_etiqueta.pop(etiqueta, set()):
+                    if clave in self._entradas:
+                        self._quitar(clave)
+                        self.invalidaciones += 1
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._generacion += 1
+            self._entradas.clear()
+            self._por_etiqueta.clear()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidaciones": self.invalidaciones,
+            }
+
+    def _quitar(self, clave: str) -> None:
+        entrada = self._entradas.pop(clave)
+        for etiqueta in entrada.etiquetas:
+            claves = self._por_etiqueta.get(etiqueta)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves:
+                    del self._por_etiqueta[etiqueta]
+
+
+# Cache de los endpoints de catálogo
+catalogo = CacheRespuestas(
+    maxsize=int(os.getenv("CACHE_MAXSIZE", 1024)),
+    ttl=float(os.getenv("CACHE_TTL", 60)),
+)
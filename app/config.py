@@ -1,6 +1,8 @@
 # examples/standard/app/config.py
 
-from pydantic import BaseModel, EmailStr, Field
+import os
+
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional
 
 
@@ -11,9 +13,42 @@ class User(BaseModel):
 
 
 class AuthenticationSettings(BaseModel):
-    secret: str = "asodiufcnp8ufni80qn0crn2u903nwcauf0unq2nc2uic90"
+    # Obligatorio: con un secreto conocido cualquiera puede firmar tokens
+    secret: str = Field(os.getenv("JWT_SECRET", ""), validate_default=True)
     jwt_algorithm: str = "HS256"
     expiration_seconds: int = 3600 * 24  # 1 hour
 
+    @field_validator("secret")
+    @classmethod
+    def _secreto_largo(cls, valor: str) -> str:
+        if len(valor) < 32:
+            raise ValueError("JWT_SECRET debe estar definido, con al menos 32 caracteres")
+        return valor
+
+
+class PasswordSettings(BaseModel):
+    # Costo de bcrypt; al cambiarlo los hashes viejos se regeneran en el login
+    bcrypt_rounds: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    # Hilos dedicados a hashear, para no agotar el threadpool de FastAPI
+    hash_workers: int = int(os.getenv("HASH_WORKERS", 4))
+
+
+class TokenSettings(BaseModel):
+    # Tokens ya verificados que se guardan en memoria
+    cache_maxsize: int = int(os.getenv("AUTH_CACHE_MAXSIZE", 10000))
+    # Cada cuántos segundos se leen las revocaciones hechas por otros workers
+    revocaciones_refresco: float = float(os.getenv("AUTH_REVOCACIONES_REFRESCO", 5))
+
+
+class ThrottleSettings(BaseModel):
+    # Intentos por minuto (y ráfaga máxima) de login y registro
+    enabled: bool = os.getenv("THROTTLE_ENABLED", "1") == "1"
+    login_por_ip: int = Field(int(os.getenv("THROTTLE_LOGIN_POR_IP", 30)), ge=1)
+    login_por_usuario: int = Field(int(os.getenv("THROTTLE_LOGIN_POR_USUARIO", 5)), ge=1)
+    registro_por_ip: int = Field(int(os.getenv("THROTTLE_REGISTRO_POR_IP", 10)), ge=1)
+    registro_por_usuario: int = Field(int(os.getenv("THROTTLE_REGISTRO_POR_USUARIO", 3)), ge=1)
+    # Buckets guardados en memoria; los menos usados se descartan
+    maxsize: int = int(os.getenv("THROTTLE_MAXSIZE", 100000))
+
 
-__all__ = ["AuthenticationSettings"]
\ No newline at end of file
+__all__ = ["AuthenticationSettings", "PasswordSettings", "TokenSettings", "ThrottleSettings"]
\ No newline at end of file
@@ -0,0 +1,256 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import delete, exists, func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+from app.dependencies import Paginacion
+
+
+# ==========================
+#   VERSIONES
+# ==========================
+def nueva_version(objeto) -> None:
+    """
+    Incrementar `version` (usada para ETags) en el próximo UPDATE del objeto.
+    Se calcula en SQL, así dos escrituras concurrentes no quedan con la misma.
+    """
+    objeto.version = type(objeto).version + 1
+
+
+# ==========================
+#   RESERVAS
+# ==========================
+def reservar_lugar(db: Session, turno_id: int, usuario_id: int) -> int:
+    """
+    Ocupar un lugar en un turno y crear la reserva, sin hacer commit.
+    Devuelve el id de la reserva.
+
+    El lugar se toma con un único UPDATE condicional sobre `reservas_count`,
+    así dos pedidos concurrentes nunca pueden superar la capacidad. Los
+    duplicados los detecta la constraint `uq_turno_usuario` (ON CONFLICT DO
+    NOTHING); en ese caso se devuelve el lugar. Como nunca se hace rollback,
+    varias reservas pueden compartir la misma transacción.
+    """
+    ocupado = db.execute(
+        update(models.Turno)
+        .where(
+            models.Turno.id == turno_id,
+            models.Turno.reservas_count < models.Turno.capacidad,
+        )
+        .values(reservas_count=models.Turno.reservas_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if ocupado.rowcount == 0:
+        existe = db.query(models.Turno.id).filter(models.Turno.id == turno_id).first()
+        if not existe:
+            raise HTTPException(status_code=404, detail="Turno no encontrado")
+        raise HTTPException(
+            status_code=400, detail="No hay lugares disponibles en este turno"
+        )
+
+    reserva_id = db.execute(
+        sqlite_insert(models.Reserva)
+        .values(turno_id=turno_id, usuario_id=usuario_id)
+        .on_conflict_do_nothing(index_elements=["turno_id", "usuario_id"])
+        .returning(models.Reserva.id)
+    ).scalar()
+    if reserva_id is None:
+        _devolver_lugar(db, turno_id)
+        raise HTTPException(status_code=400, detail="El usuario ya reservó este turno")
+    return reserva_id
+
+
+def _devolver_lugar(db: Session, turno_id: int) -> None:
+    db.execute(
+        update(models.Turno)
+        .where(models.Turno.id == turno_id, models.Turno.reservas_count > 0)
+        .values(reservas_count=models.Turno.reservas_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def liberar_lugar(db: Session, reserva_id: int) -> Optional[int]:
+    """
+    Eliminar una reserva y devolver su lugar al turno, sin hacer commit.
+    Devuelve el turno_id, o None si la reserva no existía (o la borró un
+    request concurrente): en ese caso no se devuelve ningún lugar.
+    """
+    turno_id = db.execute(
+        delete(models.Reserva)
+        .where(models.Reserva.id == reserva_id)
+        .returning(models.Reserva.turno_id)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if turno_id is not None:
+        _devolver_lugar(db, turno_id)
+    return turno_id
+
+
+# ==========================
+#   LISTA DE ESPERA
+# ==========================
+def anotar_espera(db: Session, turno_id: int, usuario_id: int) -> int:
+    """
+    Agregar al usuario al final de la lista de espera del turno, sin hacer
+    commit. Devuelve el id de la espera.
+
+    Empieza por el INSERT para tomar el lock de escritura antes de mirar el
+    turno: así no se cruza con un lugar que se libera en ese momento.
+    """
+    espera_id = db.execute(
+        sqlite_insert(models.Espera)
+        .values(turno_id=turno_id, usuario_id=usuario_id)
+        .on_conflict_do_nothing(index_elements=["turno_id", "usuario_id"])
+        .returning(models.Espera.id)
+    ).scalar()
+    if espera_id is None:
+        raise HTTPException(
+            status_code=400, detail="El usuario ya está en la lista de espera de este turno"
+        )
+    existe = db.query(models.Turno.id).filter(models.Turno.id == turno_id).first()
+    if not existe:
+        raise HTTPException(status_code=404, detail="Turno no encontrado")
+    reservado = (
+        db.query(models.Reserva.id)
+        .filter(models.Reserva.turno_id == turno_id, models.Reserva.usuario_id == usuario_id)
+        .first()
+    )
+    if reservado:
+        raise HTTPException(status_code=400, detail="El usuario ya reservó este turno")
+    return espera_id
+
+
+def posicion_espera(db: Session, turno_id: int, espera_id: int) -> int:
+    return (
+        db.query(func.count(models.Espera.id))
+        .filter(models.Espera.turno_id == turno_id, models.Espera.id <= espera_id)
+        .scalar()
+    )
+
+
+def promover_esperas(db: Session, turno_id: int) -> List[Tuple[int, int]]:
+    """
+    Dar los lugares libres del turno a los primeros de su lista de espera,
+    en la transacción en curso y sin hacer commit.
+    Devuelve (reserva_id, usuario_id) de cada reserva creada.
+    """
+    espera = models.Espera
+    # Cambios pendientes del ORM (reserva borrada, capacidad nueva)
+    db.flush()
+    if not db.query(espera.id).filter(espera.turno_id == turno_id).first():
+        return []
+    # Quien consiguió lugar por su cuenta deja de esperar
+    db.execute(
+        delete(espera)
+        .where(
+            espera.turno_id == turno_id,
+            exists().where(
+                models.Reserva.turno_id == espera.turno_id,
+                models.Reserva.usuario_id == espera.usuario_id,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    libres = (
+        db.query(models.Turno.capacidad - models.Turno.reservas_count)
+        .filter(models.Turno.id == turno_id)
+        .scalar()
+    )
+    if not libres or libres < 1:
+        return []
+    siguientes = (
+        db.query(espera.id, espera.usuario_id)
+        .filter(espera.turno_id == turno_id)
+        .order_by(espera.id)
+        .limit(libres)
+        .all()
+    )
+    promovidas = [
+        (reservar_lugar(db, turno_id, siguiente.usuario_id), siguiente.usuario_id)
+        for siguiente in siguientes
+    ]
+    if siguientes:
+        db.execute(
+            delete(espera)
+            .where(espera.id.in_([siguiente.id for siguiente in siguientes]))
+            .execution_options(synchronize_session=False)
+        )
+    return promovidas
+
+
+# ==========================
+#   TURNOS
+# ==========================
+def contar_recurrencia(datos: schemas.TurnoRecurrenteCreate) -> int:
+    """
+    Cantidad de turnos que genera una recurrencia semanal, sin generarlos.
+    """
+    total_dias = (datos.fecha_hasta - datos.fecha_desde).days + 1
+    semanas, resto = divmod(total_dias, 7)
+    # Los `resto` días que sobran son los primeros de la semana, desde fecha_desde
+    sobrantes = {(datos.fecha_desde.weekday() + i) % 7 for i in range(resto)}
+    fechas = sum(semanas + (dia in sobrantes) for dia in set(datos.dias_semana))
+    return fechas * len(set(datos.horas))
+
+
+def expandir_recurrencia(datos: schemas.TurnoRecurrenteCreate) -> list:
+    """
+    Generar las filas de turnos de una recurrencia semanal, en orden cronológico.
+    """
+    dias = set(datos.dias_semana)
+    horas = sorted(set(datos.horas))
+    filas = []
+    fecha = datos.fecha_desde
+    while fecha <= datos.fecha_hasta:
+        if fecha.weekday() in dias:
+            for hora in horas:
+                filas.append(
+                    {
+                        "servicio_id": datos.servicio_id,
+                        "fecha_hora_inicio": datetime.combine(fecha, hora),
+                        "duracion_minutos": datos.duracion_minutos,
+                        "capacidad": datos.capacidad,
+                        "precio": datos.precio,
+                    }
+                )
+        fecha += timedelta(days=1)
+    return filas
+
+
+def insertar_turnos(db: Session, filas: list) -> List[int]:
+    """
+    Insertar todos los turnos con un único INSERT ... RETURNING, sin hacer commit.
+    Devuelve los ids en el mismo orden que `filas`.
+    """
+    if not filas:
+        return []
+    resultado = db.execute(
+        insert(models.Turno).returning(
+            models.Turno.id, sort_by_parameter_order=True
+        ),
+        filas,
+    )
+    return list(resultado.scalars())
+
+
+# ==========================
+#   PAGINACIÓN
+# ==========================
+def paginar(query, columna_id, paginacion: Paginacion, response: Response) -> list:
+    """
+    Devolver una página de `query` ordenada por `columna_id`.
+
+    Se pide un registro de más para saber si hay otra página; en ese caso
+    el id del último elemento se envía en el header `X-Next-Cursor`.
+    """
+    if paginacion.cursor is not None:
+        query = query.filter(columna_id > paginacion.cursor)
+    filas = query.order_by(columna_id).limit(paginacion.limit + 1).all()
+    if len(filas) > paginacion.limit:
+        filas = filas[: paginacion.limit]
+        response.headers["X-Next-Cursor"] = str(filas[-1].id)
+    return filas
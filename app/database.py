@@ -1,10 +1,71 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = "sqlite:///./basedatos.db"
+# Con un driver async (p.ej. sqlite+aiosqlite:///./basedatos.db) la API usa AsyncSession
+DATABASE_URL = os.getenv("DATABASE_URL") or "sqlite:///./basedatos.db"
+
+url = make_url(DATABASE_URL)
+ASYNC_MODE = url.get_dialect().is_async
+
+connect_args = {"check_same_thread": False}
+
+# Una base SQLite en memoria usa un pool de una sola conexión, que no acepta
+# estos parámetros
+EN_MEMORIA = url.get_backend_name() == "sqlite" and (
+    url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+)
+
+# Pool de conexiones (QueuePool), configurable por entorno
+pool_args = {} if EN_MEMORIA else {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", -1)),
+}
+
+# PRAGMAs aplicados a cada conexión nueva. En WAL los lectores no se bloquean
+# mientras se escribe una reserva, y synchronous=NORMAL es seguro con WAL.
+# cache_size es por conexión: en el peor caso se usan
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW) x SQLITE_CACHE_KB, 120 MiB por engine con
+# los valores por defecto (en modo async hay dos engines).
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", 8 * 1024)),  # negativo = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", 256 * 1024 * 1024)),
+    "temp_store": "MEMORY",
+}
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+def _aplicar_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, valor in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma} = {valor}")
+    cursor.close()
+
+
+# Engine sync: la API en modo sync, y en ambos modos el DDL, las migraciones y los scripts
+engine = create_engine(
+    url.set(drivername=url.get_backend_name()), connect_args=connect_args, **pool_args
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if ASYNC_MODE:
+    async_engine = create_async_engine(url, connect_args=connect_args, **pool_args)
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+
+if url.get_backend_name() == "sqlite":
+    event.listen(engine, "connect", _aplicar_pragmas)
+    if async_engine is not None:
+        event.listen(async_engine.sync_engine, "connect", _aplicar_pragmas)
+
 Base = declarative_base()
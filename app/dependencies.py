@@ -1,9 +1,105 @@
-from app import database
+import functools
+import inspect
+from typing import Optional
+
+from fastapi import Query
+from fastapi.params import Depends
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app import database, profiler
+
+# Tamaño de página por defecto y máximo para los listados
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
 
 # --- Dependencia DB ---
-def get_db():
+def get_db_sync():
     db = database.SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+if database.ASYNC_MODE:
+
+    async def get_db():
+        async with database.AsyncSessionLocal() as db:
+            yield db
+
+else:
+    get_db = get_db_sync
+
+
+async def ejecutar(db, fn, *args):
+    """
+    Ejecutar `fn(session, *args)` desde un endpoint async sin bloquear el
+    event loop: con AsyncSession vía run_sync, con Session en el threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+
+class RutaDB(APIRoute):
+    """
+    En modo async, los endpoints sync que dependen de `get_db` reciben en
+    cambio una Session sync (`get_db_sync`): FastAPI los corre en el
+    threadpool como en modo sync, sin bloquear el event loop, y valida la
+    respuesta una sola vez. AsyncSession queda para los endpoints async.
+
+    Con el profiler habilitado, además envuelve los endpoints que corren en
+    el threadpool para que su cuerpo quede en el perfil.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        parametro = _parametro_db(endpoint) if database.ASYNC_MODE else None
+        if parametro:
+            endpoint = _con_sesion_sync(endpoint, parametro)
+        if profiler.PROFILER_ENABLED and not inspect.iscoroutinefunction(endpoint):
+            endpoint = profiler.envolver(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _con_sesion_sync(endpoint, parametro: str):
+    firma = inspect.signature(endpoint)
+
+    @functools.wraps(endpoint)
+    def adaptado(*args, **kwargs):
+        return endpoint(*args, **kwargs)
+
+    adaptado.__signature__ = firma.replace(
+        parameters=[
+            p.replace(default=Depends(get_db_sync)) if nombre == parametro else p
+            for nombre, p in firma.parameters.items()
+        ]
+    )
+    return adaptado
+
+
+def _parametro_db(endpoint) -> Optional[str]:
+    if inspect.iscoroutinefunction(endpoint):
+        return None
+    for nombre, parametro in inspect.signature(endpoint).parameters.items():
+        if isinstance(parametro.default, Depends) and parametro.default.dependency is get_db:
+            return nombre
+    return None
+
+
+# --- Dependencia de paginación ---
+class Paginacion:
+    """
+    Paginación por cursor (keyset sobre `id`). El cursor es el último id
+    recibido; la siguiente página se pide con `?cursor=<X-Next-Cursor>`.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[int] = Query(None, ge=0),
+        limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        self.cursor = cursor
+        self.limit = limit
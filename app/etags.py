@@ -0,0 +1,42 @@
+"""
+ETags fuertes y GET condicional (If-None-Match -> 304).
+
+El ETag se calcula a partir de ids y columnas `version`, sin serializar
+la respuesta, así un recurso que no cambió no se vuelve a armar ni enviar.
+"""
+import hashlib
+
+from fastapi import Request, Response
+
+
+def calcular(*partes) -> str:
+    digest = hashlib.blake2b(repr(partes).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def coincide(request: Request, etag: str) -> bool:
+    """
+    Comparación débil de If-None-Match, como indica RFC 9110.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidato in header.split(","):
+        candidato = candidato.strip()
+        if candidato == "*" or candidato.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def no_modificado(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def condicional(request: Request, respuesta: Response) -> Response:
+    """
+    Devolver 304 si la respuesta (p.ej. una cacheada) tiene el ETag pedido.
+    """
+    etag = respuesta.headers.get("etag")
+    if etag and coincide(request, etag):
+        return no_modificado(etag)
+    return respuesta
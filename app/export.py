@@ -0,0 +1,77 @@
+"""
+Exportación en streaming (NDJSON o CSV) para conciliaciones.
+
+Las filas se leen con `yield_per`, así SQLite las va entregando de a
+bloques y nunca se arma la lista completa en memoria. El generador abre
+su propia sesión sync porque la de `get_db` se cierra antes de que
+empiece el streaming.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+
+from app import database
+
+# Filas leídas por bloque y escritas por chunk de la respuesta
+YIELD_PER = 1000
+
+
+class Formato(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+def _valor(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+
+def _filas(consulta: Select):
+    with database.SessionLocal() as db:
+        resultado = db.execute(consulta.execution_options(yield_per=YIELD_PER))
+        yield resultado.keys()
+        for bloque in resultado.partitions():
+            yield bloque
+
+
+def _ndjson(consulta: Select):
+    filas = _filas(consulta)
+    columnas = list(next(filas))
+    for bloque in filas:
+        yield "".join(
+            json.dumps(dict(zip(columnas, map(_valor, fila))), ensure_ascii=False) + "\n"
+            for fila in bloque
+        )
+
+
+def _csv(consulta: Select):
+    filas = _filas(consulta)
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(next(filas))
+    for bloque in filas:
+        escritor.writerows([map(_valor, fila) for fila in bloque])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Encabezado, si no hubo filas
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def respuesta(consulta: Select, formato: Formato, nombre: str) -> StreamingResponse:
+    if formato == Formato.csv:
+        contenido, media_type = _csv(consulta), "text/csv"
+    else:
+        contenido, media_type = _ndjson(consulta), "application/x-ndjson"
+    return StreamingResponse(
+        contenido,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{nombre}.{formato.value}"'
+        },
+    )
@@ -0,0 +1,240 @@
+"""
+Soporte de `Idempotency-Key` para los POST que crean reservas, turnos y servicios.
+
+Un cliente que reintenta un POST con el mismo header recibe la primera
+respuesta guardada, con `Idempotent-Replayed: true`, sin que el handler
+vuelva a correr.
+
+- La clave vale por usuario y por ruta. También se guarda la huella del
+  cuerpo: reutilizar la clave con otro cuerpo responde 422.
+- Las respuestas se guardan en la tabla claves_idempotencia, compartida por
+  todos los workers, y vencen a las IDEMPOTENCIA_TTL_HORAS.
+- Mientras el primer request está en curso, los duplicados esperan. En el
+  mismo worker los serializa un asyncio.Lock por clave. Entre workers, la
+  fila queda reservada sin respuesta y los demás la consultan hasta que
+  aparezca, o responden 409 después de IDEMPOTENCIA_ESPERA segundos.
+- Se guardan las respuestas 2xx y 4xx. Un 5xx o una excepción liberan la
+  clave para que el reintento vuelva a ejecutar el handler.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import database, models
+
+HEADER = "idempotency-key"
+# POST que aceptan la clave
+RUTAS = {"/reservas/", "/turnos/", "/servicios/"}
+MAX_LARGO_CLAVE = 255
+
+TTL = timedelta(hours=float(os.getenv("IDEMPOTENCIA_TTL_HORAS", 24)))
+# Cuánto espera un duplicado a que termine el request original en otro worker
+ESPERA = float(os.getenv("IDEMPOTENCIA_ESPERA", 10))
+# Si el worker que tomó la clave muere, otro puede tomarla después de esto
+RESERVA = timedelta(seconds=60)
+INTERVALO_CONSULTA = 0.05
+# Cada cuántos segundos se borran las claves vencidas
+PODA_SEGUNDOS = 300
+
+_proxima_poda = 0.0
+
+
+def _digest(*partes: bytes) -> str:
+    sha = hashlib.sha256()
+    for parte in partes:
+        sha.update(parte)
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+# --- Acceso a la tabla, desde el threadpool ---
+def _tomar(clave: str, huella: str) -> Optional[Row]:
+    """
+    Reservar la clave si está libre (o vencida) y devolver None; si no,
+    devolver la fila existente.
+    """
+    global _proxima_poda
+    tabla = models.ClaveIdempotencia
+    ahora = datetime.utcnow()
+    with database.engine.begin() as conn:
+        if time.monotonic() >= _proxima_poda:
+            _proxima_poda = time.monotonic() + PODA_SEGUNDOS
+            conn.execute(delete(tabla).where(tabla.expira <= ahora))
+        tomada = conn.execute(
+            sqlite_insert(tabla)
+            .values(clave=clave, huella=huella, expira=ahora + RESERVA)
+            .on_conflict_do_update(
+                index_elements=["clave"],
+                set_={
+                    "huella": huella,
+                    "estado": None,
+                    "tipo": None,
+                    "cuerpo": None,
+                    "expira": ahora + RESERVA,
+                },
+                where=tabla.expira <= ahora,
+            )
+            .returning(tabla.clave)
+        ).first()
+        if tomada is not None:
+            return None
+        return conn.execute(select(tabla).where(tabla.clave == clave)).first()
+
+
+def _guardar(clave: str, estado: int, tipo: Optional[str], cuerpo: bytes) -> None:
+    tabla = models.ClaveIdempotencia
+    with database.engine.begin() as conn:
+        conn.execute(
+            update(tabla)
+            .where(tabla.clave == clave)
+            .values(estado=estado, tipo=tipo, cuerpo=cuerpo, expira=datetime.utcnow() + TTL)
+        )
+
+
+def _liberar(clave: str) -> None:
+    tabla = models.ClaveIdempotencia
+    with database.engine.begin() as conn:
+        conn.execute(delete(tabla).where(tabla.clave == clave))
+
+
+class IdempotencyMiddleware:
+    """
+    Va dentro de la autenticación, para que la clave sea por usuario.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # (event loop, clave) -> [lock, requests que lo usan]. Entre loops (o
+        # workers) los duplicados se serializan por la fila de la tabla
+        self._locks: Dict[Tuple[asyncio.AbstractEventLoop, str], list] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in RUTAS
+        ):
+            await self.app(scope, receive, send)
+            return
+        valor = _header(scope, HEADER.encode())
+        if valor is None:
+            await self.app(scope, receive, send)
+            return
+        if not valor or len(valor) > MAX_LARGO_CLAVE:
+            await _error(400, "Idempotency-Key inválida", scope, receive, send)
+            return
+
+        cuerpo, mensajes = await _leer_cuerpo(receive)
+        usuario = getattr(scope.get("state", {}).get("user"), "username", "")
+        clave = _digest(usuario.encode(), scope["path"].encode(), valor)
+        huella = _digest(cuerpo)
+
+        llave = (asyncio.get_running_loop(), clave)
+        entrada = self._locks.setdefault(llave, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            async with entrada[0]:
+                await self._atender(scope, mensajes, receive, send, clave, huella)
+        finally:
+            entrada[1] -= 1
+            if not entrada[1]:
+                del self._locks[llave]
+
+    async def _atender(
+        self,
+        scope: Scope,
+        mensajes: List[Message],
+        receive: Receive,
+        send: Send,
+        clave: str,
+        huella: str,
+    ) -> None:
+        limite = time.monotonic() + ESPERA
+        while True:
+            fila = await run_in_threadpool(_tomar, clave, huella)
+            if fila is None:
+                break
+            if fila.huella != huella:
+                detalle = "La Idempotency-Key ya se usó con otro cuerpo"
+                await _error(422, detalle, scope, receive, send)
+                return
+            if fila.estado is not None:
+                guardada = Response(
+                    fila.cuerpo,
+                    status_code=fila.estado,
+                    media_type=fila.tipo,
+                    headers={"Idempotent-Replayed": "true"},
+                )
+                await guardada(scope, receive, send)
+                return
+            # En curso en otro worker
+            if time.monotonic() >= limite:
+                detalle = "Hay un request en curso con esta Idempotency-Key"
+                await _error(409, detalle, scope, receive, send)
+                return
+            await asyncio.sleep(INTERVALO_CONSULTA)
+
+        async def receive_retenido() -> Message:
+            # Primero el cuerpo ya leído, después los mensajes del cliente
+            if mensajes:
+                return mensajes.pop(0)
+            return await receive()
+
+        respuesta: List[Message] = []
+
+        async def send_retenido(mensaje: Message) -> None:
+            respuesta.append(mensaje)
+
+        try:
+            await self.app(scope, receive_retenido, send_retenido)
+        except BaseException:
+            await run_in_threadpool(_liberar, clave)
+            raise
+
+        inicio = respuesta[0]
+        if inicio["status"] < 500:
+            tipo = _header(inicio, b"content-type")
+            cuerpo = b"".join(m.get("body", b"") for m in respuesta[1:])
+            await run_in_threadpool(
+                _guardar, clave, inicio["status"], tipo and tipo.decode("latin-1"), cuerpo
+            )
+        else:
+            await run_in_threadpool(_liberar, clave)
+        for mensaje in respuesta:
+            await send(mensaje)
+
+
+def _header(mensaje: dict, nombre: bytes) -> Optional[bytes]:
+    for clave, valor in mensaje.get("headers", []):
+        if clave.lower() == nombre:
+            return valor
+    return None
+
+
+async def _leer_cuerpo(receive: Receive) -> Tuple[bytes, List[Message]]:
+    """Leer el cuerpo completo, guardando los mensajes para pasárselos a la app."""
+    mensajes: List[Message] = []
+    partes = []
+    while True:
+        mensaje = await receive()
+        mensajes.append(mensaje)
+        if mensaje["type"] != "http.request":
+            break
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body", False):
+            break
+    return b"".join(partes), mensajes
+
+
+async def _error(estado: int, detalle: str, scope: Scope, receive: Receive, send: Send) -> None:
+    await JSONResponse({"detail": detalle}, status_code=estado)(scope, receive, send)
@@ -0,0 +1,230 @@
+"""
+Avisos en vivo de lugares disponibles, para no tener que hacer polling.
+
+Un cliente se suscribe por WebSocket a un servicio y/o un emprendedor. Los
+handlers que cambian la ocupación de un turno publican, después del commit,
+un evento en el hub del proceso, que lo reparte a cada suscripción
+interesada. Los handlers corren en el threadpool, así que la entrega se
+agenda en el event loop de cada suscripción.
+
+Cada suscripción tiene una cola acotada. Un cliente que no la vacía a
+tiempo se desconecta en lugar de perder eventos en silencio: los eventos
+de reservas son deltas y saltearse uno dejaría el contador mal. Al
+reconectar, el cliente vuelve a consultar el estado por HTTP.
+"""
+import asyncio
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app import models
+
+# Eventos pendientes por suscripción antes de desconectarla
+MAX_PENDIENTES = int(os.getenv("LIVE_MAX_PENDIENTES", 256))
+
+
+class Desbordada(Exception):
+    pass
+
+
+class Suscripcion:
+    __slots__ = ("topicos", "_loop", "_pendientes", "_hay", "desbordada")
+
+    def __init__(self, topicos: List[str], loop: asyncio.AbstractEventLoop):
+        self.topicos = topicos
+        self._loop = loop
+        self._pendientes: deque = deque()
+        self._hay = asyncio.Event()
+        self.desbordada = False
+
+    def _entregar(self, evento: dict) -> None:
+        # Corre en el event loop de la suscripción
+        if len(self._pendientes) >= MAX_PENDIENTES:
+            self.desbordada = True
+        else:
+            self._pendientes.append(evento)
+        self._hay.set()
+
+    async def siguiente(self) -> dict:
+        """
+        Esperar el próximo evento; lanza Desbordada si se perdieron eventos.
+        """
+        await self._hay.wait()
+        if self.desbordada:
+            raise Desbordada()
+        evento = self._pendientes.popleft()
+        if not self._pendientes:
+            self._hay.clear()
+        return evento
+
+
+class Hub:
+    """
+    Pub/sub en memoria por tópico ("servicio:3", "emprendedor:1").
+    Publicar es seguro desde cualquier hilo.
+    """
+
+    def __init__(self):
+        self._por_topico: Dict[str, Set[Suscripcion]] = {}
+        self._lock = threading.Lock()
+        self.publicados = 0
+        self.desbordadas = 0
+
+    def activo(self) -> bool:
+        return bool(self._por_topico)
+
+    @contextmanager
+    def suscribir(self, topicos: Iterable[str]) -> Iterator[Suscripcion]:
+        suscripcion = Suscripcion(list(topicos), asyncio.get_running_loop())
+        with self._lock:
+            for topico in suscripcion.topicos:
+                self._por_topico.setdefault(topico, set()).add(suscripcion)
+        try:
+            yield suscripcion
+        finally:
+            with self._lock:
+                for topico in suscripcion.topicos:
+                    suscripciones = self._por_topico.get(topico)
+                    if suscripciones is not None:
+                        suscripciones.discard(suscripcion)
+                        if not suscripciones:
+                            del self._por_topico[topico]
+                if suscripcion.desbordada:
+                    self.desbordadas += 1
+
+    def publicar(self, topicos: Iterable[str], evento: dict) -> None:
+        with self._lock:
+            destinos = set()
+            for topico in topicos:
+                destinos.update(self._por_topico.get(topico, ()))
+            self.publicados += 1
+        # Una sola llamada por event loop: despertar un loop tiene su costo
+        por_loop: Dict[asyncio.AbstractEventLoop, List[Suscripcion]] = {}
+        for suscripcion in destinos:
+            por_loop.setdefault(suscripcion._loop, []).append(suscripcion)
+        for loop, suscripciones in por_loop.items():
+            try:
+                loop.call_soon_threadsafe(_entregar_a_todas, suscripciones, evento)
+            except RuntimeError:
+                # Ese loop ya se cerró
+                pass
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "topicos": len(self._por_topico),
+                "suscripciones": len(set().union(*self._por_topico.values())),
+                "publicados": self.publicados,
+                "desbordadas": self.desbordadas,
+            }
+
+
+def _entregar_a_todas(suscripciones: List[Suscripcion], evento: dict) -> None:
+    for suscripcion in suscripciones:
+        suscripcion._entregar(evento)
+
+
+hub = Hub()
+
+
+def topicos(servicio_id: Optional[int], emprendedor_id: Optional[int]) -> List[str]:
+    resultado = []
+    if servicio_id is not None:
+        resultado.append(f"servicio:{servicio_id}")
+    if emprendedor_id is not None:
+        resultado.append(f"emprendedor:{emprendedor_id}")
+    return resultado
+
+
+# --- Publicación desde los handlers, después del commit ---
+def _ubicar(db: Session, turno_id: int):
+    return (
+        db.query(models.Turno.servicio_id, models.Servicio.emprendedor_id)
+        .join(models.Servicio, models.Turno.servicio_id == models.Servicio.id)
+        .filter(models.Turno.id == turno_id)
+        .first()
+    )
+
+
+def publicar_lugares(db: Session, turno_id: int, delta: int) -> None:
+    """
+    Avisar que los lugares disponibles de un turno cambiaron en `delta`.
+    Sin suscripciones no hace ninguna query.
+    """
+    if not hub.activo():
+        return
+    fila = _ubicar(db, turno_id)
+    if fila is None:
+        return
+    hub.publicar(
+        topicos(fila.servicio_id, fila.emprendedor_id),
+        {
+            "evento": "lugares",
+            "turno_id": turno_id,
+            "servicio_id": fila.servicio_id,
+            "delta": delta,
+        },
+    )
+
+
+def publicar_turno(db: Session, turno: models.Turno) -> None:
+    """
+    Avisar el estado completo de un turno modificado.
+    """
+    if not hub.activo():
+        return
+    fila = _ubicar(db, turno.id)
+    if fila is None:
+        return
+    hub.publicar(
+        topicos(fila.servicio_id, fila.emprendedor_id),
+        {
+            "evento": "turno",
+            "turno_id": turno.id,
+            "servicio_id": turno.servicio_id,
+            "capacidad": turno.capacidad,
+            "lugares_disponibles": turno.capacidad - turno.reservas_count,
+        },
+    )
+
+
+def publicar_promovidas(db: Session, turno_id: int, promovidas) -> None:
+    """
+    Avisar qué reservas se crearon desde la lista de espera de un turno.
+    Los lugares que ocupan ya van en el evento "lugares" o "turno".
+    """
+    if not promovidas or not hub.activo():
+        return
+    fila = _ubicar(db, turno_id)
+    if fila is None:
+        return
+    hub.publicar(
+        topicos(fila.servicio_id, fila.emprendedor_id),
+        {
+            "evento": "espera_promovida",
+            "turno_id": turno_id,
+            "servicio_id": fila.servicio_id,
+            "reservas": [
+                {"reserva_id": reserva_id, "usuario_id": usuario_id}
+                for reserva_id, usuario_id in promovidas
+            ],
+        },
+    )
+
+
+def publicar_turno_eliminado(db: Session, turno_id: int, servicio_id: int) -> None:
+    if not hub.activo():
+        return
+    emprendedor_id = (
+        db.query(models.Servicio.emprendedor_id)
+        .filter(models.Servicio.id == servicio_id)
+        .scalar()
+    )
+    hub.publicar(
+        topicos(servicio_id, emprendedor_id),
+        {"evento": "turno_eliminado", "turno_id": turno_id, "servicio_id": servicio_id},
+    )
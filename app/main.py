@@ -1,25 +1,65 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from typing import List
-from app import models, schemas, database
+import asyncio
+from collections import Counter
+
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, status
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from contextlib import asynccontextmanager
+from app import models, schemas, database, crud, migrations, cache, etags, export, render, metrics, profiler, throttle, search, live, stats, archive, idempotency
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 
 from fastapi_auth_jwt import JWTAuthenticationMiddleware
 from app.routers.usuarios import auth_backend
-from app.dependencies import get_db
+from app.dependencies import get_db, Paginacion, RutaDB, MAX_PAGE_SIZE
 from app.routers.usuarios import router as routerUsuarios
 
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Archivo periódico de turnos terminados (ver app/archive.py)
+    archivo = (
+        asyncio.create_task(archive.periodicamente()) if archive.INTERVALO > 0 else None
+    )
+    yield
+    if archivo is not None:
+        archivo.cancel()
+    # Cerrar las conexiones aiosqlite (cada una corre en su propio hilo)
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+
+
+# Ventana máxima de búsqueda en /disponibilidad
+MAX_VENTANA_DISPONIBILIDAD = timedelta(days=31)
+# Máximo de turnos que puede generar una recurrencia
+MAX_TURNOS_RECURRENTES = 20000
+
+
 # Create FastAPI app and add middleware
-app = FastAPI()
+app = FastAPI(
+    lifespan=lifespan,
+    # Opt-in: codificar con orjson todas las respuestas que no son listados
+    default_response_class=ORJSONResponse if render.FAST_JSON else JSONResponse,
+)
+app.router.route_class = RutaDB
+
+# Dentro de la autenticación: las Idempotency-Key son por usuario
+app.add_middleware(idempotency.IdempotencyMiddleware)
 
 app.add_middleware(
     JWTAuthenticationMiddleware,
     backend=auth_backend,
-    exclude_urls=["/registro", "/login"],
+    exclude_urls=["/registro", "/login", "/metrics"],
 )
 
+if profiler.PROFILER_ENABLED:
+    # Por fuera de la autenticación, para que el perfil la incluya
+    app.add_middleware(profiler.ProfilerMiddleware)
+    metrics.instalar_hooks()
+
 origins = [
     "*", 
 ]
@@ -30,9 +70,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],         # Métodos HTTP permitidos
     allow_headers=["*"],         # Headers permitidos
+    # Cursor de la siguiente página, ETag y respuestas repetidas por Idempotency-Key
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
 )
 
+if metrics.METRICS_ENABLED:
+    # Último agregado = más externo: mide también la autenticación
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instalar_hooks()
+
 models.Base.metadata.create_all(bind=database.engine)
+migrations.migrar(database.engine)
 
 
 app.include_router(routerUsuarios)
@@ -40,6 +88,20 @@ app.include_router(routerUsuarios)
 
 
 
+def _validar_ids(ids: List[int], paginacion: Paginacion) -> set:
+    """
+    Ids pedidos con ?ids=1&ids=2..., resueltos con una sola query IN.
+    Todos entran en una sola página, sin importar `limit`.
+    """
+    ids = set(ids)
+    if len(ids) > MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"No se pueden pedir más de {MAX_PAGE_SIZE} ids"
+        )
+    paginacion.limit = len(ids)
+    return ids
+
+
 # ==========================
 #   EMPRENDEDORES
 # ==========================
@@ -63,31 +125,59 @@ def crear_emprendedor(
     nuevo = models.Emprendedor(**emprendedor.dict())
     db.add(nuevo)
     db.commit()
+    cache.catalogo.invalidar("emprendedores")
     db.refresh(nuevo)
     return nuevo
 
 
 @app.get("/emprendedores/", response_model=List[schemas.EmprendedorResponse])
-def listar_emprendedores(db: Session = Depends(get_db)):
+def listar_emprendedores(
+    request: Request,
+    response: Response,
+    paginacion: Paginacion = Depends(),
+    db: Session = Depends(get_db),
+):
     """
-    Obtener todos los emprendedores.
+    Obtener los emprendedores, paginados por cursor.
     """
-    return db.query(models.Emprendedor).all()
+    consulta = cache.catalogo.consultar(request)
+    if consulta.respuesta:
+        return consulta.respuesta
+
+    query = db.query(models.Emprendedor).options(
+        joinedload(models.Emprendedor.usuario)
+    )
+    emprendedores = crud.paginar(query, models.Emprendedor.id, paginacion, response)
+    etiquetas = {"emprendedores"} | {f"usuario:{e.usuario_id}" for e in emprendedores}
+    return consulta.guardar(
+        List[schemas.EmprendedorResponse], emprendedores, etiquetas, response
+    )
 
 
 @app.get("/emprendedores/{emprendedor_id}", response_model=schemas.EmprendedorResponse)
-def detalle_emprendedor(emprendedor_id: int, db: Session = Depends(get_db)):
+def detalle_emprendedor(
+    emprendedor_id: int, request: Request, db: Session = Depends(get_db)
+):
     """
     Obtener todos los datos de un emprendedor
     """
+    consulta = cache.catalogo.consultar(request)
+    if consulta.respuesta:
+        return consulta.respuesta
+
     emprendedor = (
         db.query(models.Emprendedor)
+        .options(joinedload(models.Emprendedor.usuario))
         .filter(models.Emprendedor.id == emprendedor_id)
         .first()
     )
     if not emprendedor:
         raise HTTPException(status_code=404, detail="Emprendedor no encontrado")
-    return emprendedor
+    return consulta.guardar(
+        schemas.EmprendedorResponse,
+        emprendedor,
+        {f"emprendedor:{emprendedor_id}", f"usuario:{emprendedor.usuario_id}"},
+    )
 
 
 @app.put("/emprendedores/{emprendedor_id}", response_model=schemas.EmprendedorResponse)
@@ -106,7 +196,9 @@ def actualizar_emprendedor(
         raise HTTPException(status_code=404, detail="Emprendedor no encontrado")
     for campo, valor in datos.dict().items():
         setattr(emprendedor, campo, valor)
+    crud.nueva_version(emprendedor)
     db.commit()
+    cache.catalogo.invalidar(f"emprendedor:{emprendedor_id}", "emprendedores")
     db.refresh(emprendedor)
     return emprendedor
 
@@ -125,17 +217,78 @@ def eliminar_emprendedor(emprendedor_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Emprendedor no encontrado")
     db.delete(emprendedor)
     db.commit()
+    cache.catalogo.invalidar(f"emprendedor:{emprendedor_id}", "emprendedores")
     return {"ok": True, "mensaje": "Emprendedor eliminado"}
 
 
+@app.get(
+    "/emprendedores/{emprendedor_id}/estadisticas",
+    response_model=schemas.EstadisticasEmprendedor,
+)
+def estadisticas_emprendedor(
+    emprendedor_id: int,
+    desde: date,
+    hasta: date,
+    granularidad: stats.Granularidad = stats.Granularidad.dia,
+    db: Session = Depends(get_db),
+):
+    """
+    Turnos, lugares, reservas, ingresos y ocupación por día, semana o mes
+    de los turnos entre `desde` y `hasta` (inclusive). Se lee del resumen
+    diario, así que el costo no depende de la cantidad de reservas.
+    """
+    if hasta < desde:
+        raise HTTPException(status_code=400, detail="'hasta' no puede ser anterior a 'desde'")
+    existe = (
+        db.query(models.Emprendedor.id)
+        .filter(models.Emprendedor.id == emprendedor_id)
+        .first()
+    )
+    if not existe:
+        raise HTTPException(status_code=404, detail="Emprendedor no encontrado")
+
+    def periodo(desde, turnos, lugares, reservas, ingresos):
+        return {
+            "desde": desde,
+            "turnos": turnos,
+            "lugares": lugares,
+            "reservas": reservas,
+            "ingresos": round(ingresos, 2),
+            "ocupacion": round(reservas / lugares, 4) if lugares else 0.0,
+        }
+
+    filas = stats.consultar(db, emprendedor_id, desde, hasta, granularidad)
+    periodos = [periodo(*fila) for fila in filas]
+    total = periodo(
+        desde,
+        *(sum(p[campo] for p in periodos) for campo in ("turnos", "lugares", "reservas", "ingresos")),
+    )
+    return {
+        "emprendedor_id": emprendedor_id,
+        "granularidad": granularidad.value,
+        "periodos": periodos,
+        "total": total,
+    }
+
+
 @app.get(
     "/emprendedores/{emprendedor_id}/servicios",
     response_model=list[schemas.ServicioResponse],
 )
-def listar_servicios_y_turnos(emprendedor_id: int, db: Session = Depends(get_db)):
+def listar_servicios_y_turnos(
+    emprendedor_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+):
     """
     Dada la Id de un emprendedor, listar todos los servicios que tiene disponibles.
+    Soporta If-None-Match.
     """
+    consulta = cache.catalogo.consultar(request)
+    if consulta.respuesta:
+        return etags.condicional(request, consulta.respuesta)
+
     emprendedor = (
         db.query(models.Usuario)
         .filter(
@@ -148,10 +301,28 @@ def listar_servicios_y_turnos(emprendedor_id: int, db: Session = Depends(get_db)
 
     servicios = (
         db.query(models.Servicio)
+        .options(selectinload(models.Servicio.turnos))
         .filter(models.Servicio.emprendedor_id == emprendedor_id)
         .all()
     )
-    return servicios
+    etag = etags.calcular(
+        emprendedor_id,
+        [
+            (s.id, s.version, [(t.id, t.version) for t in s.turnos])
+            for s in servicios
+        ],
+    )
+    if etags.coincide(request, etag):
+        return etags.no_modificado(etag)
+    response.headers["ETag"] = etag
+
+    # El 404 depende del rol del usuario: un cambio de rol invalida la entrada
+    etiquetas = {f"emprendedor_servicios:{emprendedor_id}", f"usuario:{emprendedor.id}"}
+    for servicio in servicios:
+        etiquetas |= {f"servicio:{servicio.id}", f"turnos_servicio:{servicio.id}"}
+    return consulta.guardar(
+        list[schemas.ServicioResponse], servicios, etiquetas, response
+    )
 
 
 # ==========================
@@ -170,23 +341,50 @@ def crear_servicio(servicio: schemas.ServicioCreate, db: Session = Depends(get_d
     nuevo = models.Servicio(**servicio.dict())
     db.add(nuevo)
     db.commit()
+    cache.catalogo.invalidar(
+        "servicios", f"emprendedor_servicios:{servicio.emprendedor_id}"
+    )
     db.refresh(nuevo)
     return nuevo
 
 
 @app.get("/servicios/", response_model=List[schemas.ServicioResponseCreate])
-def listar_servicios(db: Session = Depends(get_db)):
-    return db.query(models.Servicio).all()
+def listar_servicios(
+    request: Request,
+    response: Response,
+    ids: Optional[List[int]] = Query(None),
+    paginacion: Paginacion = Depends(),
+    db: Session = Depends(get_db),
+):
+    consulta = cache.catalogo.consultar(request)
+    if consulta.respuesta:
+        return consulta.respuesta
+
+    query = db.query(models.Servicio)
+    if ids:
+        query = query.filter(models.Servicio.id.in_(_validar_ids(ids, paginacion)))
+    servicios = crud.paginar(query, models.Servicio.id, paginacion, response)
+    return consulta.guardar(
+        List[schemas.ServicioResponseCreate], servicios, {"servicios"}, response
+    )
 
 
 @app.get("/servicios/{servicio_id}", response_model=schemas.ServicioResponseCreate)
-def detalle_servicio(servicio_id: int, db: Session = Depends(get_db)):
+def detalle_servicio(
+    servicio_id: int, request: Request, db: Session = Depends(get_db)
+):
+    consulta = cache.catalogo.consultar(request)
+    if consulta.respuesta:
+        return consulta.respuesta
+
     servicio = (
         db.query(models.Servicio).filter(models.Servicio.id == servicio_id).first()
     )
     if not servicio:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
-    return servicio
+    return consulta.guardar(
+        schemas.ServicioResponseCreate, servicio, {f"servicio:{servicio_id}"}
+    )
 
 
 @app.put("/servicios/{servicio_id}", response_model=schemas.ServicioResponseCreate)
@@ -200,7 +398,9 @@ def actualizar_servicio(
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
     for campo, valor in datos.dict().items():
         setattr(servicio, campo, valor)
+    crud.nueva_version(servicio)
     db.commit()
+    cache.catalogo.invalidar(f"servicio:{servicio_id}", "servicios")
     db.refresh(servicio)
     return servicio
 
@@ -214,6 +414,7 @@ def eliminar_servicio(servicio_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
     db.delete(servicio)
     db.commit()
+    cache.catalogo.invalidar(f"servicio:{servicio_id}", "servicios")
     return {"ok": True, "mensaje": "Servicio eliminado"}
 
 
@@ -233,20 +434,82 @@ def crear_turno(turno: schemas.TurnoCreate, db: Session = Depends(get_db)):
     nuevo = models.Turno(**turno.dict())
     db.add(nuevo)
     db.commit()
+    cache.catalogo.invalidar(f"turnos_servicio:{turno.servicio_id}")
     db.refresh(nuevo)
     return nuevo
 
 
+@app.post("/turnos/recurrentes", response_model=schemas.TurnosGenerados)
+def crear_turnos_recurrentes(
+    datos: schemas.TurnoRecurrenteCreate, db: Session = Depends(get_db)
+):
+    """
+    Publicar una agenda semanal: genera un turno por cada día de `dias_semana`
+    y cada hora de `horas` entre las dos fechas, en una sola transacción.
+    """
+    if datos.fecha_hasta < datos.fecha_desde:
+        raise HTTPException(
+            status_code=400, detail="'fecha_hasta' debe ser posterior a 'fecha_desde'"
+        )
+    if any(dia < 0 or dia > 6 for dia in datos.dias_semana):
+        raise HTTPException(
+            status_code=400, detail="Los días de la semana van de 0 (lunes) a 6 (domingo)"
+        )
+    servicio = (
+        db.query(models.Servicio.id)
+        .filter(models.Servicio.id == datos.servicio_id)
+        .first()
+    )
+    if not servicio:
+        raise HTTPException(status_code=404, detail="Servicio no encontrado")
+
+    # Antes de generar las filas: un rango de décadas no llega a construirse
+    if crud.contar_recurrencia(datos) > MAX_TURNOS_RECURRENTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La recurrencia genera más de {MAX_TURNOS_RECURRENTES} turnos",
+        )
+    filas = crud.expandir_recurrencia(datos)
+    ids = crud.insertar_turnos(db, filas)
+    db.commit()
+    cache.catalogo.invalidar(f"turnos_servicio:{datos.servicio_id}")
+    return {"cantidad": len(ids), "ids": ids}
+
+
 @app.get("/turnos/", response_model=List[schemas.TurnoResponseCreate])
-def listar_turnos(db: Session = Depends(get_db)):
-    return db.query(models.Turno).all()
+def listar_turnos(
+    response: Response,
+    ids: Optional[List[int]] = Query(None),
+    servicio_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    paginacion: Paginacion = Depends(),
+    db: Session = Depends(get_db),
+):
+    query = db.query(*render.columnas(models.Turno, schemas.TurnoResponseCreate))
+    if ids:
+        query = query.filter(models.Turno.id.in_(_validar_ids(ids, paginacion)))
+    if servicio_id is not None:
+        query = query.filter(models.Turno.servicio_id == servicio_id)
+    if desde is not None:
+        query = query.filter(models.Turno.fecha_hora_inicio >= desde)
+    if hasta is not None:
+        query = query.filter(models.Turno.fecha_hora_inicio < hasta)
+    turnos = crud.paginar(query, models.Turno.id, paginacion, response)
+    return render.lista(schemas.TurnoResponseCreate, turnos, response)
 
 
 @app.get("/turnos/{turno_id}", response_model=schemas.TurnoResponseCreate)
-def detalle_turno(turno_id: int, db: Session = Depends(get_db)):
+def detalle_turno(
+    turno_id: int, request: Request, response: Response, db: Session = Depends(get_db)
+):
     turno = db.query(models.Turno).filter(models.Turno.id == turno_id).first()
     if not turno:
         raise HTTPException(status_code=404, detail="Turno no encontrado")
+    etag = etags.calcular(turno.id, turno.version)
+    if etags.coincide(request, etag):
+        return etags.no_modificado(etag)
+    response.headers["ETag"] = etag
     return turno
 
 
@@ -259,8 +522,14 @@ def actualizar_turno(
         raise HTTPException(status_code=404, detail="Turno no encontrado")
     for campo, valor in datos.dict().items():
         setattr(turno, campo, valor)
+    crud.nueva_version(turno)
+    # Si subió la capacidad, los lugares nuevos van a la lista de espera
+    promovidas = crud.promover_esperas(db, turno_id)
     db.commit()
+    cache.catalogo.invalidar(f"turnos_servicio:{turno.servicio_id}")
     db.refresh(turno)
+    live.publicar_turno(db, turno)
+    live.publicar_promovidas(db, turno_id, promovidas)
     return turno
 
 
@@ -269,51 +538,223 @@ def eliminar_turno(turno_id: int, db: Session = Depends(get_db)):
     turno = db.query(models.Turno).filter(models.Turno.id == turno_id).first()
     if not turno:
         raise HTTPException(status_code=404, detail="Turno no encontrado")
+    servicio_id = turno.servicio_id
+    db.query(models.Espera).filter(models.Espera.turno_id == turno_id).delete(
+        synchronize_session=False
+    )
     db.delete(turno)
     db.commit()
+    cache.catalogo.invalidar(f"turnos_servicio:{servicio_id}")
+    live.publicar_turno_eliminado(db, turno_id, servicio_id)
     return {"ok": True, "mensaje": "Turno eliminado"}
 
 
+@app.post("/turnos/{turno_id}/espera", response_model=schemas.EsperaResponse)
+def anotar_en_espera(
+    turno_id: int, datos: schemas.EsperaCreate, db: Session = Depends(get_db)
+):
+    """
+    Anotarse en la lista de espera de un turno lleno, en lugar de reintentar
+    la reserva. Cuando se libera un lugar, el primero de la lista recibe la
+    reserva en la misma transacción. Si justo hay un lugar libre, se reserva
+    en el momento y la respuesta trae `reserva_id`.
+    """
+    espera_id = crud.anotar_espera(db, turno_id, datos.usuario_id)
+    promovidas = crud.promover_esperas(db, turno_id)
+    db.commit()
+    if promovidas:
+        live.publicar_lugares(db, turno_id, -len(promovidas))
+        live.publicar_promovidas(db, turno_id, promovidas)
+    reserva_id = next((r for r, u in promovidas if u == datos.usuario_id), None)
+    return {
+        "id": espera_id,
+        "turno_id": turno_id,
+        "usuario_id": datos.usuario_id,
+        "posicion": None if reserva_id else crud.posicion_espera(db, turno_id, espera_id),
+        "reserva_id": reserva_id,
+    }
+
+
+@app.delete("/turnos/{turno_id}/espera/{usuario_id}")
+def salir_de_espera(turno_id: int, usuario_id: int, db: Session = Depends(get_db)):
+    borradas = (
+        db.query(models.Espera)
+        .filter(models.Espera.turno_id == turno_id, models.Espera.usuario_id == usuario_id)
+        .delete(synchronize_session=False)
+    )
+    if not borradas:
+        raise HTTPException(status_code=404, detail="El usuario no está en la lista de espera")
+    db.commit()
+    return {"ok": True, "mensaje": "Salió de la lista de espera"}
+
+
 # ==========================
-#   RESERVAS
+#   BÚSQUEDA
 # ==========================
-@app.post("/reservas/", response_model=schemas.ReservaResponse)
-def crear_reserva(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)):
-    turno = db.query(models.Turno).filter(models.Turno.id == reserva.turno_id).first()
-    if not turno:
-        raise HTTPException(status_code=404, detail="Turno no encontrado")
-
-    # Chequear capacidad
-    reservas_existentes = (
-        db.query(models.Reserva).filter(models.Reserva.turno_id == turno.id).count()
+@app.get("/buscar", response_model=List[schemas.ResultadoBusqueda])
+def buscar(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    tipo: Optional[search.Tipo] = None,
+    paginacion: Paginacion = Depends(),
+    db: Session = Depends(get_db),
+):
+    """
+    Buscar emprendedores (negocio, descripción) y servicios (nombre,
+    descripción) por texto, del más al menos relevante. Cada palabra de `q`
+    se busca como prefijo. Acá el cursor es la cantidad de resultados ya
+    recibidos, porque el orden es por relevancia y no por id.
+    """
+    consulta_fts = search.consulta_fts(q)
+    if consulta_fts is None:
+        raise HTTPException(status_code=400, detail="La búsqueda no tiene palabras")
+
+    consulta = cache.catalogo.consultar(request)
+    if consulta.respuesta:
+        return consulta.respuesta
+
+    offset = paginacion.cursor or 0
+    filas = search.buscar(db, consulta_fts, tipo, paginacion.limit + 1, offset)
+    if len(filas) > paginacion.limit:
+        filas = filas[: paginacion.limit]
+        response.headers["X-Next-Cursor"] = str(offset + paginacion.limit)
+    resultados = [
+        schemas.ResultadoBusqueda(**fila._mapping, score=-fila.rank) for fila in filas
+    ]
+    return consulta.guardar(
+        List[schemas.ResultadoBusqueda], resultados, {"emprendedores", "servicios"}, response
     )
-    if reservas_existentes >= turno.capacidad:
+
+
+# ==========================
+#   DISPONIBILIDAD
+# ==========================
+@app.get("/disponibilidad", response_model=List[schemas.TurnoDisponible])
+def buscar_disponibilidad(
+    desde: datetime,
+    hasta: datetime,
+    emprendedor_id: Optional[int] = None,
+    servicio_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Turnos con lugares libres que empiezan en [desde, hasta), en orden cronológico.
+    Una sola query sobre el índice de fecha_hora_inicio usando reservas_count.
+    """
+    if hasta <= desde:
+        raise HTTPException(status_code=400, detail="'hasta' debe ser posterior a 'desde'")
+    if hasta - desde > MAX_VENTANA_DISPONIBILIDAD:
         raise HTTPException(
-            status_code=400, detail="No hay lugares disponibles en este turno"
+            status_code=400,
+            detail=f"La ventana no puede superar {MAX_VENTANA_DISPONIBILIDAD.days} días",
         )
 
-    # Chequear si el usuario ya reservó este turno
-    ya_reservo = (
-        db.query(models.Reserva)
+    query = (
+        db.query(
+            models.Turno.id,
+            models.Turno.servicio_id,
+            models.Servicio.nombre.label("servicio_nombre"),
+            models.Servicio.emprendedor_id,
+            models.Turno.fecha_hora_inicio,
+            models.Turno.duracion_minutos,
+            models.Turno.capacidad,
+            models.Turno.precio,
+            (models.Turno.capacidad - models.Turno.reservas_count).label(
+                "lugares_disponibles"
+            ),
+        )
+        .join(models.Servicio, models.Turno.servicio_id == models.Servicio.id)
         .filter(
-            models.Reserva.turno_id == turno.id,
-            models.Reserva.usuario_id == reserva.usuario_id,
+            models.Turno.fecha_hora_inicio >= desde,
+            models.Turno.fecha_hora_inicio < hasta,
+            models.Turno.reservas_count < models.Turno.capacidad,
         )
-        .first()
     )
-    if ya_reservo:
-        raise HTTPException(status_code=400, detail="El usuario ya reservó este turno")
+    if servicio_id is not None:
+        query = query.filter(models.Turno.servicio_id == servicio_id)
+    if emprendedor_id is not None:
+        query = query.filter(models.Servicio.emprendedor_id == emprendedor_id)
+
+    filas = query.order_by(models.Turno.fecha_hora_inicio, models.Turno.id).all()
+    return [schemas.TurnoDisponible(**fila._mapping) for fila in filas]
 
-    nueva = models.Reserva(**reserva.dict())
-    db.add(nueva)
+
+# ==========================
+#   RESERVAS
+# ==========================
+@app.post("/reservas/", response_model=schemas.ReservaResponse)
+def crear_reserva(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)):
+    """
+    Reservar un lugar en un turno. La capacidad y los duplicados se validan
+    en la misma transacción que inserta la reserva. Acepta Idempotency-Key.
+    """
+    reserva_id = crud.reservar_lugar(db, reserva.turno_id, reserva.usuario_id)
+    db.commit()
+    live.publicar_lugares(db, reserva.turno_id, -1)
+    return {"id": reserva_id, **reserva.dict()}
+
+
+@app.post("/reservas/batch", response_model=List[schemas.ReservaBatchResultado])
+def crear_reservas_batch(datos: schemas.ReservaBatch, db: Session = Depends(get_db)):
+    """
+    Reservar varios pares (turno, usuario) en una sola transacción, con las
+    mismas reglas que crear_reserva. Devuelve un resultado por ítem, en orden.
+    """
+    resultados = []
+    for reserva in datos.reservas:
+        try:
+            reserva_id = crud.reservar_lugar(db, reserva.turno_id, reserva.usuario_id)
+        except HTTPException as exc:
+            resultados.append(
+                {
+                    **reserva.dict(),
+                    "ok": False,
+                    "status_code": exc.status_code,
+                    "detalle": exc.detail,
+                }
+            )
+        else:
+            resultados.append(
+                {**reserva.dict(), "ok": True, "status_code": 200, "reserva_id": reserva_id}
+            )
     db.commit()
-    db.refresh(nueva)
-    return nueva
+    ocupados = Counter(r["turno_id"] for r in resultados if r["ok"])
+    for turno_id, cantidad in ocupados.items():
+        live.publicar_lugares(db, turno_id, -cantidad)
+    return resultados
 
 
 @app.get("/reservas/", response_model=List[schemas.ReservaResponse])
-def listar_reservas(db: Session = Depends(get_db)):
-    return db.query(models.Reserva).all()
+def listar_reservas(
+    response: Response,
+    turno_id: Optional[int] = None,
+    usuario_id: Optional[int] = None,
+    incluir_historico: bool = False,
+    paginacion: Paginacion = Depends(),
+    db: Session = Depends(get_db),
+):
+    """
+    Listar reservas. Con incluir_historico=true se suman las de turnos archivados.
+    """
+    def consulta(tabla):
+        consulta = select(*render.columnas(tabla, schemas.ReservaResponse))
+        if turno_id is not None:
+            consulta = consulta.where(tabla.turno_id == turno_id)
+        if usuario_id is not None:
+            consulta = consulta.where(tabla.usuario_id == usuario_id)
+        return consulta
+
+    if incluir_historico:
+        # Los ids de reservas no se reutilizan, así que el cursor sirve para ambas
+        reservas = union_all(
+            consulta(models.Reserva), consulta(models.ReservaHistorica)
+        ).subquery()
+    else:
+        reservas = consulta(models.Reserva).subquery()
+    query = db.query(*reservas.c)
+    filas = crud.paginar(query, reservas.c.id, paginacion, response)
+    return render.lista(schemas.ReservaResponse, filas, response)
 
 
 @app.get("/reservas/{reserva_id}", response_model=schemas.ReservaResponse)
@@ -326,38 +767,218 @@ def detalle_reserva(reserva_id: int, db: Session = Depends(get_db)):
 
 @app.delete("/reservas/{reserva_id}")
 def eliminar_reserva(reserva_id: int, db: Session = Depends(get_db)):
-    reserva = db.query(models.Reserva).filter(models.Reserva.id == reserva_id).first()
-    if not reserva:
+    turno_id = crud.liberar_lugar(db, reserva_id)
+    if turno_id is None:
         raise HTTPException(status_code=404, detail="Reserva no encontrada")
-    db.delete(reserva)
+    # El lugar pasa al primero de la lista de espera, si hay
+    promovidas = crud.promover_esperas(db, turno_id)
     db.commit()
+    if len(promovidas) != 1:
+        live.publicar_lugares(db, turno_id, 1 - len(promovidas))
+    live.publicar_promovidas(db, turno_id, promovidas)
     return {"ok": True, "mensaje": "Reserva eliminada"}
 
 
+def _reservas_usuario(db: Session, reservas, turnos, usuario_id: int) -> list:
+    # Proyección de columnas: una sola query, sin cargar Reserva/Turno/Servicio
+    return (
+        db.query(
+            reservas.id,
+            reservas.turno_id,
+            turnos.fecha_hora_inicio,
+            turnos.precio,
+            models.Servicio.nombre.label("servicio_nombre"),
+            models.Servicio.emprendedor_id,
+            turnos.version.label("turno_version"),
+            models.Servicio.version.label("servicio_version"),
+        )
+        .join(turnos, reservas.turno_id == turnos.id)
+        .join(models.Servicio, turnos.servicio_id == models.Servicio.id)
+        .filter(reservas.usuario_id == usuario_id)
+        .order_by(reservas.id)
+        .all()
+    )
+
+
 @app.get("/usuarios/{usuario_id}/reservas", response_model=list[schemas.ReservaOut])
-def listar_reservas_usuario(usuario_id: int, db: Session = Depends(get_db)):
-    usuario = db.query(models.Usuario).filter(models.Usuario.id == usuario_id).first()
+def listar_reservas_usuario(
+    usuario_id: int,
+    request: Request,
+    response: Response,
+    incluir_historico: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Listar las reservas de un usuario con los datos de su turno y servicio.
+    Con incluir_historico=true se suman las de turnos archivados.
+    Soporta If-None-Match.
+    """
+    usuario = db.query(models.Usuario.id).filter(models.Usuario.id == usuario_id).first()
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-    reservas = (
-        db.query(models.Reserva)
+    filas = _reservas_usuario(db, models.Reserva, models.Turno, usuario_id)
+    if incluir_historico:
+        historicas = _reservas_usuario(
+            db, models.ReservaHistorica, models.TurnoHistorico, usuario_id
+        )
+        filas = sorted(filas + historicas, key=lambda fila: fila.id)
+    # Una reserva no se modifica: alcanza con su id y las versiones de su
+    # turno y servicio
+    etag = etags.calcular(
+        usuario_id,
+        [(f.id, f.turno_version, f.servicio_version) for f in filas],
+    )
+    if etags.coincide(request, etag):
+        return etags.no_modificado(etag)
+    response.headers["ETag"] = etag
+    return [schemas.ReservaOut(**fila._mapping) for fila in filas]
+
+
+# ==========================
+#   EXPORTACIÓN
+# ==========================
+@app.get("/exportar/reservas")
+def exportar_reservas(
+    formato: export.Formato = export.Formato.ndjson,
+    usuario_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+):
+    """
+    Exportar en streaming las reservas con los campos de ReservaOut y el usuario_id.
+    `desde`/`hasta` filtran por la fecha de inicio del turno.
+    """
+    consulta = (
+        select(
+            models.Reserva.id,
+            models.Reserva.usuario_id,
+            models.Reserva.turno_id,
+            models.Turno.fecha_hora_inicio,
+            models.Turno.precio,
+            models.Servicio.nombre.label("servicio_nombre"),
+            models.Servicio.emprendedor_id,
+        )
         .join(models.Turno, models.Reserva.turno_id == models.Turno.id)
         .join(models.Servicio, models.Turno.servicio_id == models.Servicio.id)
-        .filter(models.Reserva.usuario_id == usuario_id)
-        .all()
+        .order_by(models.Reserva.id)
     )
+    if usuario_id is not None:
+        consulta = consulta.where(models.Reserva.usuario_id == usuario_id)
+    if desde is not None:
+        consulta = consulta.where(models.Turno.fecha_hora_inicio >= desde)
+    if hasta is not None:
+        consulta = consulta.where(models.Turno.fecha_hora_inicio < hasta)
+    return export.respuesta(consulta, formato, "reservas")
+
+
+@app.get("/exportar/turnos")
+def exportar_turnos(
+    formato: export.Formato = export.Formato.ndjson,
+    servicio_id: Optional[int] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+):
+    """
+    Exportar en streaming los turnos, con la cantidad de lugares ocupados.
+    """
+    consulta = select(
+        models.Turno.id,
+        models.Turno.servicio_id,
+        models.Turno.fecha_hora_inicio,
+        models.Turno.duracion_minutos,
+        models.Turno.capacidad,
+        models.Turno.precio,
+        models.Turno.reservas_count,
+    ).order_by(models.Turno.id)
+    if servicio_id is not None:
+        consulta = consulta.where(models.Turno.servicio_id == servicio_id)
+    if desde is not None:
+        consulta = consulta.where(models.Turno.fecha_hora_inicio >= desde)
+    if hasta is not None:
+        consulta = consulta.where(models.Turno.fecha_hora_inicio < hasta)
+    return export.respuesta(consulta, formato, "turnos")
 
-    resultados = [
-        schemas.ReservaOut(
-            id=r.id,
-            turno_id=r.turno.id,
-            fecha_hora_inicio=r.turno.fecha_hora_inicio,
-            precio=r.turno.precio,
-            servicio_nombre=r.turno.servicio.nombre,
-            emprendedor_id=r.turno.servicio.emprendedor_id,
-        )
-        for r in reservas
-    ]
-    return resultados
 
+# ==========================
+#   EN VIVO
+# ==========================
+@app.websocket("/ws/lugares")
+async def lugares_en_vivo(
+    websocket: WebSocket,
+    token: str,
+    servicio_id: Optional[int] = None,
+    emprendedor_id: Optional[int] = None,
+):
+    """
+    Eventos de lugares disponibles de los turnos de un servicio y/o de un
+    emprendedor. El JWT va en `?token=`: el middleware no autentica
+    WebSockets y los navegadores no permiten mandarles headers.
+    """
+    topicos = live.topicos(servicio_id, emprendedor_id)
+    try:
+        usuario = await auth_backend.authenticate(token)
+    except Exception:
+        # Token inválido, vencido o revocado
+        usuario = None
+    if usuario is None or not topicos:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    with live.hub.suscribir(topicos) as suscripcion:
+        recibir = asyncio.ensure_future(websocket.receive())
+        siguiente = asyncio.ensure_future(suscripcion.siguiente())
+        try:
+            while True:
+                await asyncio.wait({recibir, siguiente}, return_when=asyncio.FIRST_COMPLETED)
+                if recibir.done():
+                    if recibir.result()["type"] == "websocket.disconnect":
+                        return
+                    # Los mensajes del cliente se ignoran
+                    recibir = asyncio.ensure_future(websocket.receive())
+                if siguiente.done():
+                    await websocket.send_json(siguiente.result())
+                    siguiente = asyncio.ensure_future(suscripcion.siguiente())
+        except live.Desbordada:
+            await websocket.close(
+                code=status.WS_1013_TRY_AGAIN_LATER,
+                reason="Demasiados eventos pendientes, volver a consultar",
+            )
+        finally:
+            recibir.cancel()
+            siguiente.cancel()
+
+
+# ==========================
+#   CACHE
+# ==========================
+@app.get("/cache/estadisticas")
+def estadisticas_cache():
+    """
+    Hits, misses y tamaño del cache de catálogo, para dimensionarlo.
+    """
+    return cache.catalogo.estadisticas()
+
+
+@app.get("/limites/estadisticas")
+def estadisticas_limites():
+    """
+    Intentos permitidos y rechazados por el límite de login y registro.
+    """
+    return {limitador.nombre: limitador.estadisticas() for limitador in throttle.limitadores}
+
+
+# ==========================
+#   MÉTRICAS
+# ==========================
+if metrics.METRICS_ENABLED:
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def exportar_metricas():
+        """
+        Métricas en formato de texto de Prometheus.
+        """
+        return PlainTextResponse(
+            metrics.registro.exportar(), media_type="text/plain; version=0.0.4"
+        )
@@ -0,0 +1,222 @@
+"""
+Métricas por ruta en formato de texto de Prometheus.
+
+Un middleware ASGI mide la latencia de cada request y los hooks
+before/after_cursor_execute de SQLAlchemy cuentan las queries y el tiempo
+de DB del request en curso (vía un ContextVar). Solo se instala con
+METRICS_ENABLED=1; apagado no agrega ningún costo.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import cache, database, live, throttle
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+
+# Límites superiores (segundos) de los buckets del histograma de latencia
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ConsumoDB:
+    """Queries y tiempo de DB acumulados por un request."""
+
+    __slots__ = ("queries", "segundos")
+
+    def __init__(self):
+        self.queries = 0
+        self.segundos = 0.0
+
+
+consumo_actual: ContextVar[Optional[ConsumoDB]] = ContextVar("consumo_db", default=None)
+
+
+class _Serie:
+    __slots__ = ("buckets", "suma", "cantidad", "queries", "db_segundos")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.suma = 0.0
+        self.cantidad = 0
+        self.queries = 0
+        self.db_segundos = 0.0
+
+
+class Registro:
+    def __init__(self):
+        self._series: Dict[Tuple[str, str], _Serie] = {}
+        self._respuestas: Dict[Tuple[str, str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def observar(
+        self, metodo: str, ruta: str, status: int, segundos: float, consumo: ConsumoDB
+    ) -> None:
+        with self._lock:
+            serie = self._series.get((metodo, ruta))
+            if serie is None:
+                serie = self._series[(metodo, ruta)] = _Serie()
+            serie.buckets[bisect_left(BUCKETS, segundos)] += 1
+            serie.suma += segundos
+            serie.cantidad += 1
+            serie.queries += consumo.queries
+            serie.db_segundos += consumo.segundos
+            clave = (metodo, ruta, status)
+            self._respuestas[clave] = self._respuestas.get(clave, 0) + 1
+
+    def exportar(self) -> str:
+        lineas = [
+            "# HELP http_requests_total Requests atendidos.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for (metodo, ruta, status), total in sorted(self._respuestas.items()):
+                lineas.append(
+                    f'http_requests_total{{method="{metodo}",route="{ruta}",status="{status}"}} {total}'
+                )
+            series = sorted(self._series.items())
+
+            lineas += [
+                "# HELP http_request_duration_seconds Latencia de los requests.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (metodo, ruta), serie in series:
+                etiquetas = f'method="{metodo}",route="{ruta}"'
+                acumulado = 0
+                for limite, cantidad in zip(BUCKETS + ("+Inf",), serie.buckets):
+                    acumulado += cantidad
+                    lineas.append(
+                        f'http_request_duration_seconds_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+                    )
+                lineas.append(f"http_request_duration_seconds_sum{{{etiquetas}}} {serie.suma}")
+                lineas.append(f"http_request_duration_seconds_count{{{etiquetas}}} {serie.cantidad}")
+
+            lineas += [
+                "# HELP db_queries_total Queries SQL ejecutadas por ruta.",
+                "# TYPE db_queries_total counter",
+            ]
+            for (metodo, ruta), serie in series:
+                lineas.append(f'db_queries_total{{method="{metodo}",route="{ruta}"}} {serie.queries}')
+            lineas += [
+                "# HELP db_query_duration_seconds_total Tiempo en la DB por ruta.",
+                "# TYPE db_query_duration_seconds_total counter",
+            ]
+            for (metodo, ruta), serie in series:
+                lineas.append(
+                    f'db_query_duration_seconds_total{{method="{metodo}",route="{ruta}"}} {serie.db_segundos}'
+                )
+
+        lineas += [
+            "# HELP catalog_cache_events_total Eventos del cache de catálogo.",
+            "# TYPE catalog_cache_events_total counter",
+        ]
+        estadisticas = cache.catalogo.estadisticas()
+        for evento in ("hits", "misses", "evictions", "invalidaciones"):
+            lineas.append(f'catalog_cache_events_total{{event="{evento}"}} {estadisticas[evento]}')
+        lineas += [
+            "# TYPE catalog_cache_entries gauge",
+            f"catalog_cache_entries {estadisticas['entradas']}",
+        ]
+
+        en_vivo = live.hub.estadisticas()
+        lineas += [
+            "# TYPE live_subscriptions gauge",
+            f"live_subscriptions {en_vivo['suscripciones']}",
+            "# TYPE live_events_published_total counter",
+            f"live_events_published_total {en_vivo['publicados']}",
+            "# TYPE live_subscriptions_overflowed_total counter",
+            f"live_subscriptions_overflowed_total {en_vivo['desbordadas']}",
+        ]
+
+        lineas += [
+            "# HELP auth_throttle_total Intentos de login y registro según el límite.",
+            "# TYPE auth_throttle_total counter",
+        ]
+        for limitador in throttle.limitadores:
+            estadisticas = limitador.estadisticas()
+            for resultado in ("permitidos", "rechazados_ip", "rechazados_usuario"):
+                lineas.append(
+                    f'auth_throttle_total{{endpoint="{limitador.nombre}",result="{resultado}"}} '
+                    f"{estadisticas[resultado]}"
+                )
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro: mide el request completo, incluida la autenticación.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        consumo = ConsumoDB()
+        token = consumo_actual.set(consumo)
+        status = 500
+        inicio = time.perf_counter()
+
+        async def send_con_status(mensaje):
+            nonlocal status
+            if mensaje["type"] == "http.response.start":
+                status = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_con_status)
+        finally:
+            consumo_actual.reset(token)
+            ruta = scope.get("route")
+            registro.observar(
+                scope["method"],
+                ruta.path if ruta is not None else "<sin ruta>",
+                status,
+                time.perf_counter() - inicio,
+                consumo,
+            )
+
+
+# --- Hooks de SQLAlchemy ---
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_inicio", []).append(time.perf_counter())
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info["metrics_inicio"].pop()
+    consumo = consumo_actual.get()
+    if consumo is not None:
+        consumo.queries += 1
+        consumo.segundos += time.perf_counter() - inicio
+
+
+def _error(contexto):
+    # Una query que falla no llega a after_cursor_execute
+    if contexto.connection is not None:
+        inicios = contexto.connection.info.get("metrics_inicio")
+        if inicios:
+            inicios.pop()
+
+
+def instalar_hooks() -> None:
+    engines = [database.engine]
+    if database.async_engine is not None:
+        engines.append(database.async_engine.sync_engine)
+    for engine in engines:
+        # Lo instalan tanto las métricas como el profiler
+        if event.contains(engine, "before_cursor_execute", _antes):
+            continue
+        event.listen(engine, "before_cursor_execute", _antes)
+        event.listen(engine, "after_cursor_execute", _despues)
+        event.listen(engine, "handle_error", _error)
@@ -0,0 +1,229 @@
+"""
+Migraciones de esquema para bases ya existentes.
+
+`Base.metadata.create_all` crea las tablas nuevas pero nunca altera las que
+ya existen. Cada migración se aplica una sola vez y la versión actual se
+guarda en `PRAGMA user_version` de SQLite. Todas son idempotentes, así una
+base recién creada por `create_all` puede pasar por ellas sin problemas.
+
+Cada migración corre en una transacción explícita que incluye el DDL y el
+cambio de `user_version`: si falla, el esquema queda como estaba.
+
+Uso: python -m app.migrations
+"""
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateTable
+
+from app import database, models, search, stats
+
+
+def _columnas(conn: Connection, tabla: str) -> set:
+    return {columna["name"] for columna in inspect(conn).get_columns(tabla)}
+
+
+def _crear_indices(conn: Connection, tabla) -> None:
+    for indice in tabla.indexes:
+        indice.create(conn, checkfirst=True)
+
+
+def _es_autoincrement(conn: Connection, tabla: str) -> bool:
+    sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :tabla"),
+        {"tabla": tabla},
+    ).scalar()
+    return "AUTOINCREMENT" in sql.upper()
+
+
+def _reconstruir(conn: Connection, modelo) -> None:
+    """
+    Volver a crear la tabla de `modelo` con su definición actual, copiando
+    las filas: se crea la nueva, se copia, se borra la vieja y se renombra la
+    nueva, dentro de la transacción de la migración. Los triggers sobre la
+    tabla se pierden.
+
+    Si quedó `_{tabla}_vieja` de una reconstrucción interrumpida (antes de
+    que el DDL fuera transaccional), los datos están ahí: se copian desde
+    esa y la tabla vacía que haya creado `create_all` se descarta.
+    """
+    tabla = modelo.__tablename__
+    vieja, nueva = f"_{tabla}_vieja", f"_{tabla}_nueva"
+    existentes = set(inspect(conn).get_table_names())
+    origen = vieja if vieja in existentes else tabla
+
+    # Copia de la definición con otro nombre, en un MetaData aparte que
+    # también tiene las tablas a las que apuntan sus claves foráneas
+    metadata = MetaData()
+    for otra in models.Base.metadata.sorted_tables:
+        otra.to_metadata(metadata)
+    copia = modelo.__table__.to_metadata(metadata, name=nueva)
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {nueva}"))
+    # Solo la tabla: sus índices llevan los nombres finales y se crean al final
+    conn.execute(CreateTable(copia))
+    columnas = ", ".join(columna.name for columna in modelo.__table__.columns)
+    conn.execute(text(f"INSERT INTO {nueva} ({columnas}) SELECT {columnas} FROM {origen}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {vieja}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {tabla}"))
+    conn.execute(text(f"ALTER TABLE {nueva} RENAME TO {tabla}"))
+    _crear_indices(conn, modelo.__table__)
+
+
+def _hay_que_reconstruir(conn: Connection, tabla: str) -> bool:
+    restos = {f"_{tabla}_vieja", f"_{tabla}_nueva"}
+    return not _es_autoincrement(conn, tabla) or bool(
+        restos & set(inspect(conn).get_table_names())
+    )
+
+
+# --- Migraciones ---
+def _001_reservas_count(conn: Connection) -> None:
+    """Contador de lugares ocupados en turnos."""
+    if "reservas_count" not in _columnas(conn, "turnos"):
+        conn.execute(
+            text(
+                "ALTER TABLE turnos "
+                "ADD COLUMN reservas_count INTEGER NOT NULL DEFAULT 0"
+            )
+        )
+    conn.execute(
+        text(
+            "UPDATE turnos SET reservas_count = "
+            "(SELECT COUNT(*) FROM reservas WHERE reservas.turno_id = turnos.id)"
+        )
+    )
+
+
+def _002_indices_fk_y_fechas(conn: Connection) -> None:
+    """Índices de claves foráneas y de fecha de inicio."""
+    for modelo in (models.Servicio, models.Turno, models.Reserva):
+        _crear_indices(conn, modelo.__table__)
+
+
+def _003_versiones(conn: Connection) -> None:
+    """Columna de revisión para los ETags."""
+    for tabla in ("emprendedores", "servicios", "turnos", "reservas"):
+        if "version" not in _columnas(conn, tabla):
+            conn.execute(
+                text(
+                    f"ALTER TABLE {tabla} "
+                    "ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+                )
+            )
+
+
+def _004_busqueda(conn: Connection) -> None:
+    """Índices FTS5 de emprendedores y servicios, con el contenido actual."""
+    search.crear(conn)
+    search.reconstruir(conn)
+
+
+def _005_estadisticas(conn: Connection) -> None:
+    """Resumen diario por emprendedor, con sus triggers y los datos actuales."""
+    models.EstadisticaDiaria.__table__.create(conn, checkfirst=True)
+    stats.crear(conn)
+    stats.backfill(conn)
+
+
+def _006_archivo(conn: Connection) -> None:
+    """
+    Tablas de archivo. turnos y reservas pasan a AUTOINCREMENT para que un id
+    archivado no se reutilice, y los triggers de estadísticas ignoran el archivo.
+    """
+    # Que renombrar la tabla nueva no valide los triggers que todavía
+    # referencian a la tabla borrada (stats.reemplazar los recrea abajo)
+    conn.execute(text("PRAGMA legacy_alter_table = ON"))
+    for modelo in (models.Reserva, models.Turno):
+        if _hay_que_reconstruir(conn, modelo.__tablename__):
+            _reconstruir(conn, modelo)
+    conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+    for modelo in (models.TurnoHistorico, models.ReservaHistorica):
+        modelo.__table__.create(conn, checkfirst=True)
+    stats.reemplazar(conn)
+
+
+def _007_idempotencia(conn: Connection) -> None:
+    """Respuestas guardadas de los POST con Idempotency-Key."""
+    models.ClaveIdempotencia.__table__.create(conn, checkfirst=True)
+
+
+def _008_esperas(conn: Connection) -> None:
+    """Listas de espera de turnos llenos."""
+    models.Espera.__table__.create(conn, checkfirst=True)
+
+
+def _009_revocaciones_usuario(conn: Connection) -> None:
+    """Revocación de todos los tokens de un usuario."""
+    models.RevocacionUsuario.__table__.create(conn, checkfirst=True)
+
+
+def _010_reservas_sin_version(conn: Connection) -> None:
+    """Las reservas no se modifican: su columna `version` nunca cambiaba."""
+    for tabla in ("reservas", "reservas_historicas"):
+        if "version" in _columnas(conn, tabla):
+            conn.execute(text(f"ALTER TABLE {tabla} DROP COLUMN version"))
+
+
+MIGRACIONES = [
+    _001_reservas_count,
+    _002_indices_fk_y_fechas,
+    _003_versiones,
+    _004_busqueda,
+    _005_estadisticas,
+    _006_archivo,
+    _007_idempotencia,
+    _008_esperas,
+    _009_revocaciones_usuario,
+    _010_reservas_sin_version,
+]
+
+
+def version_actual(conn: Connection) -> int:
+    return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+@contextmanager
+def transaccion_ddl(engine: Engine) -> Iterator[Connection]:
+    """
+    Transacción que también cubre CREATE/ALTER/DROP. pysqlite hace commit
+    antes de cada sentencia DDL; con isolation_level=None no abre ni cierra
+    transacciones por su cuenta y el BEGIN explícito las abarca a todas.
+    """
+    with engine.connect() as conn:
+        dbapi = conn.connection.driver_connection
+        nivel = dbapi.isolation_level
+        dbapi.isolation_level = None
+        try:
+            with conn.begin():
+                # IMMEDIATE: otro proceso migrando espera en vez de pisarse
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            dbapi.isolation_level = nivel
+
+
+def migrar(engine=database.engine) -> int:
+    """
+    Aplicar las migraciones pendientes, cada una en su propia transacción.
+    Devuelve la versión final del esquema.
+    """
+    with engine.connect() as conn:
+        version = version_actual(conn)
+    for numero, migracion in enumerate(MIGRACIONES, start=1):
+        if numero <= version:
+            continue
+        with transaccion_ddl(engine) as conn:
+            # Leída dentro de la transacción: otro proceso pudo haberla aplicado
+            if numero <= version_actual(conn):
+                continue
+            migracion(conn)
+            conn.execute(text(f"PRAGMA user_version = {numero}"))
+    return len(MIGRACIONES)
+
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=database.engine)
+    print(f"Esquema en la versión {migrar()}")
@@ -1,10 +1,11 @@
 from typing import Optional
 from pydantic import Field
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Text, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, Float, Text, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 import datetime
 
+
 class Usuario(Base):
     __tablename__ = "usuarios"
 
@@ -29,6 +30,8 @@ class Emprendedor(Base):
     apellido = Column(String, nullable=False)
     negocio = Column(String, nullable=False)
     descripcion = Column(Text, nullable=True)
+    # Revisión, incrementada por crud.nueva_version en cada PUT (usada para ETags)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     usuario = relationship("Usuario", back_populates="emprendedor")
     servicios = relationship("Servicio", back_populates="emprendedor")
@@ -38,9 +41,10 @@ class Servicio(Base):
     __tablename__ = "servicios"
 
     id = Column(Integer, primary_key=True, index=True)
-    emprendedor_id = Column(Integer, ForeignKey("emprendedores.id"))
+    emprendedor_id = Column(Integer, ForeignKey("emprendedores.id"), index=True)
     nombre = Column(String, nullable=False)
     descripcion = Column(Text, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     emprendedor = relationship("Emprendedor", back_populates="servicios")
     turnos = relationship("Turno", back_populates="servicio")
@@ -52,25 +56,138 @@ class Turno(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     servicio_id = Column(Integer, ForeignKey("servicios.id"))
-    fecha_hora_inicio = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    fecha_hora_inicio = Column(DateTime, nullable=False, default=datetime.datetime.utcnow, index=True)
     duracion_minutos = Column(Integer, nullable=False)
     capacidad = Column(Integer, nullable=False, default=1)
     precio = Column(Float, nullable=True)
+    # Lugares ocupados, mantenido por crud.reservar_lugar / crud.liberar_lugar
+    reservas_count = Column(Integer, nullable=False, default=0, server_default="0")
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     servicio = relationship("Servicio", back_populates="turnos")
     reservas = relationship("Reserva", back_populates="turno")
 
+    # Cubre también las búsquedas solo por servicio_id. AUTOINCREMENT: un id
+    # que pasó a turnos_historicos no se vuelve a usar
+    __table_args__ = (
+        Index("ix_turnos_servicio_fecha", "servicio_id", "fecha_hora_inicio"),
+        {"sqlite_autoincrement": True},
+    )
+
 
 class Reserva(Base):
     __tablename__ = "reservas"
 
     id = Column(Integer, primary_key=True, index=True)
     turno_id = Column(Integer, ForeignKey("turnos.id"))
-    usuario_id = Column(Integer, ForeignKey("usuarios.id"))
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), index=True)
 
     turno = relationship("Turno", back_populates="reservas")
     usuario = relationship("Usuario", back_populates="reservas")
 
-    __table_args__ = (UniqueConstraint("turno_id", "usuario_id", name="uq_turno_usuario"),)
+    # El índice de uq_turno_usuario ya sirve para buscar por turno_id
+    __table_args__ = (
+        UniqueConstraint("turno_id", "usuario_id", name="uq_turno_usuario"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class Espera(Base):
+    """
+    Lista de espera de un turno lleno; el orden de llegada es el id.
+    """
+    __tablename__ = "esperas"
+
+    id = Column(Integer, primary_key=True)
+    # Índice (turno_id, rowid): los primeros de cada turno sin ordenar
+    turno_id = Column(Integer, ForeignKey("turnos.id"), nullable=False, index=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    creada = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("turno_id", "usuario_id", name="uq_espera_turno_usuario"),
+    )
+
+
+class TurnoHistorico(Base):
+    """
+    Turno ya terminado, movido por app/archive.py con las mismas columnas e id.
+    """
+    __tablename__ = "turnos_historicos"
+
+    id = Column(Integer, primary_key=True)
+    servicio_id = Column(Integer, index=True)
+    fecha_hora_inicio = Column(DateTime, nullable=False)
+    duracion_minutos = Column(Integer, nullable=False)
+    capacidad = Column(Integer, nullable=False)
+    precio = Column(Float, nullable=True)
+    reservas_count = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+
+
+class ReservaHistorica(Base):
+    __tablename__ = "reservas_historicas"
+
+    id = Column(Integer, primary_key=True)
+    turno_id = Column(Integer, nullable=False, index=True)
+    usuario_id = Column(Integer, index=True)
+
+
+class EstadisticaDiaria(Base):
+    """
+    Ocupación e ingresos por emprendedor y día de turno. La mantienen los
+    triggers de app/stats.py; no se escribe desde el ORM.
+    """
+    __tablename__ = "estadisticas_diarias"
+
+    emprendedor_id = Column(Integer, primary_key=True)
+    fecha = Column(Date, primary_key=True)
+    turnos = Column(Integer, nullable=False, default=0)
+    lugares = Column(Integer, nullable=False, default=0)
+    reservas = Column(Integer, nullable=False, default=0)
+    ingresos = Column(Float, nullable=False, default=0)
+
+
+class TokenRevocado(Base):
+    __tablename__ = "tokens_revocados"
+
+    # AUTOINCREMENT: los ids nunca se reutilizan, así cada worker lee solo
+    # las revocaciones posteriores a la última que vio
+    id = Column(Integer, primary_key=True)
+    digest = Column(String, unique=True, nullable=False)
+    expira = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+class RevocacionUsuario(Base):
+    """
+    Todos los tokens de `username` emitidos antes de `desde` quedan revocados
+    (usuario eliminado o con otro rol). Se borra al vencer el último de ellos.
+    """
+    __tablename__ = "revocaciones_usuario"
+
+    # AUTOINCREMENT, igual que tokens_revocados
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False, index=True)
+    desde = Column(DateTime, nullable=False)
+    expira = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
 
+class ClaveIdempotencia(Base):
+    """
+    Primera respuesta a un POST con Idempotency-Key (ver app/idempotency.py).
+    Sin `estado` el request todavía está en curso.
+    """
+    __tablename__ = "claves_idempotencia"
 
+    # sha256 de usuario, ruta y clave
+    clave = Column(String, primary_key=True)
+    # sha256 del cuerpo del request
+    huella = Column(String, nullable=False)
+    estado = Column(Integer, nullable=True)
+    tipo = Column(String, nullable=True)
+    cuerpo = Column(LargeBinary, nullable=True)
+    expira = Column(DateTime, nullable=False, index=True)
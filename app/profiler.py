@@ -0,0 +1,215 @@
+"""
+Profiling a pedido de un request puntual, sin redeploy.
+
+Se activa solo si está definido PROFILER_TOKEN. Un request que trae el
+header `X-Profile-Token: <token>` (o `?_profile=<token>`) se ejecuta bajo
+cProfile; el perfil se guarda en PROFILER_DIR o, con
+`X-Profile-Output: inline` (o `?_profile_output=inline`), se devuelve como
+texto en lugar de la respuesta. Cada perfil lleva la ruta, la cantidad de
+queries y el tiempo total.
+
+cProfile solo mide el hilo donde está activo: el middleware perfila el
+event loop y `envolver` perfila en el threadpool los endpoints sync. El
+perfil del event loop incluye todo lo que corre en él mientras dura el
+request, también otros requests concurrentes: sirve para ver dónde se
+bloquea el loop, no para aislar un request en un servidor con tráfico.
+
+Hay un solo perfil a la vez por proceso (cProfile usa un hook global por
+hilo y un segundo perfil cortaría al primero); mientras tanto, otro
+request perfilado recibe 409.
+"""
+import cProfile
+import functools
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app import metrics
+
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+PROFILER_DIR = os.getenv("PROFILER_DIR", "./perfiles")
+PROFILER_ENABLED = bool(PROFILER_TOKEN)
+
+# Funciones incluidas en el reporte inline
+LINEAS_REPORTE = 60
+
+# Tomado mientras hay un request perfilado en el proceso
+_en_curso = threading.Lock()
+
+
+class _Perfil:
+    """Profilers de un request: uno por cada hilo que lo atendió."""
+
+    def __init__(self):
+        self.profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def nuevo(self) -> cProfile.Profile:
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        return profiler
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.profilers[0], stream=io.StringIO())
+        for profiler in self.profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+
+perfil_actual: ContextVar[Optional[_Perfil]] = ContextVar("perfil", default=None)
+
+
+def envolver(endpoint):
+    """
+    Perfilar también el cuerpo de un endpoint sync, que corre en el threadpool.
+    """
+
+    @functools.wraps(endpoint)
+    def envuelto(*args, **kwargs):
+        perfil = perfil_actual.get()
+        if perfil is None:
+            return endpoint(*args, **kwargs)
+        return perfil.nuevo().runcall(endpoint, *args, **kwargs)
+
+    return envuelto
+
+
+def _pedido(scope: Scope):
+    """
+    Devuelve (token, salida) pedidos por header o query string.
+    """
+    headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    token = headers.get("x-profile-token") or query.get("_profile", [None])[0]
+    salida = headers.get("x-profile-output") or query.get("_profile_output", ["file"])[0]
+    return token, salida
+
+
+class ProfilerMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token, salida = _pedido(scope)
+        if not token or not hmac.compare_digest(token, PROFILER_TOKEN):
+            await self.app(scope, receive, send)
+            return
+
+        if not _en_curso.acquire(blocking=False):
+            await JSONResponse(
+                {"detail": "Ya hay un request perfilándose"}, status_code=409
+            )(scope, receive, send)
+            return
+        try:
+            await self._perfilar(scope, receive, send, salida == "inline")
+        finally:
+            _en_curso.release()
+
+    async def _perfilar(self, scope: Scope, receive: Receive, send: Send, inline: bool) -> None:
+        perfil = _Perfil()
+        token_perfil = perfil_actual.set(perfil)
+        consumo = metrics.consumo_actual.get()
+        token_consumo = None
+        if consumo is None:
+            consumo = metrics.ConsumoDB()
+            token_consumo = metrics.consumo_actual.set(consumo)
+
+        # La respuesta se retiene hasta cerrar el perfil: así incluye el
+        # request completo (también el streaming) y lleva los tags en headers.
+        mensajes = []
+
+        async def send_retenido(mensaje):
+            mensajes.append(mensaje)
+
+        inicio = time.perf_counter()
+        profiler = perfil.nuevo()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_retenido)
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - inicio
+            perfil_actual.reset(token_perfil)
+            if token_consumo is not None:
+                metrics.consumo_actual.reset(token_consumo)
+
+        inicio_respuesta = mensajes[0] if mensajes else {"status": 500, "headers": []}
+        tags = self._tags(scope, consumo, wall, inicio_respuesta["status"])
+
+        if inline:
+            reporte = self._reporte(perfil, tags).encode()
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"text/plain; charset=utf-8"),
+                        (b"content-length", str(len(reporte)).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": reporte})
+            return
+
+        archivo = self._guardar(perfil, tags)
+        headers = list(inicio_respuesta.get("headers", [])) + [
+            (b"x-profile-file", archivo.encode()),
+            (b"x-profile-queries", str(tags["queries"]).encode()),
+            (b"x-profile-wall-ms", str(tags["wall_ms"]).encode()),
+        ]
+        await send({**inicio_respuesta, "headers": headers})
+        for mensaje in mensajes[1:]:
+            await send(mensaje)
+
+    def _tags(self, scope: Scope, consumo, wall: float, status: int) -> dict:
+        ruta = scope.get("route")
+        return {
+            "ruta": ruta.path if ruta is not None else scope["path"],
+            "metodo": scope["method"],
+            "status": status,
+            "queries": consumo.queries,
+            "db_ms": round(consumo.segundos * 1000, 1),
+            "wall_ms": round(wall * 1000, 1),
+        }
+
+    def _guardar(self, perfil: _Perfil, tags: dict) -> str:
+        """
+        Guardar el perfil en formato pstats (abrible con snakeviz o pstats).
+        El nombre del archivo lleva los tags del request.
+        """
+        os.makedirs(PROFILER_DIR, exist_ok=True)
+        ruta = re.sub(r"[^A-Za-z0-9]+", "_", tags["ruta"]).strip("_") or "raiz"
+        nombre = (
+            f"{datetime.now():%Y%m%d-%H%M%S-%f}_{tags['metodo']}_{ruta}"
+            f"_{tags['wall_ms']}ms_{tags['queries']}q.prof"
+        )
+        archivo = os.path.join(PROFILER_DIR, nombre)
+        perfil.stats().dump_stats(archivo)
+        return archivo
+
+    def _reporte(self, perfil: _Perfil, tags: dict) -> str:
+        salida = io.StringIO()
+        salida.write(
+            f"{tags['metodo']} {tags['ruta']} -> {tags['status']}\n"
+            f"wall: {tags['wall_ms']} ms | queries: {tags['queries']} "
+            f"| db: {tags['db_ms']} ms\n\n"
+        )
+        stats = perfil.stats()
+        stats.stream = salida
+        stats.sort_stats("cumulative").print_stats(LINEAS_REPORTE)
+        return salida.getvalue()
@@ -0,0 +1,60 @@
+"""
+Serialización rápida de listados.
+
+Los listados grandes se consultan proyectando solo las columnas del
+schema de respuesta. Con FAST_JSON definido, las filas se validan de una
+vez con un TypeAdapter y se codifican a JSON en pydantic-core, sin pasar
+por jsonable_encoder; sin él, FastAPI las valida y serializa con el
+response_model como cualquier otra respuesta. El schema del endpoint (y
+por lo tanto el OpenAPI) no cambia.
+"""
+import os
+import threading
+from typing import Dict, List, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+# Opt-in: codificación en bloque de listados y ORJSONResponse por defecto
+FAST_JSON = bool(os.getenv("FAST_JSON"))
+
+_adapters: Dict[object, TypeAdapter] = {}
+_lock = threading.Lock()
+
+
+def adapter(modelo) -> TypeAdapter:
+    """
+    TypeAdapter de `modelo`, construido una sola vez por proceso.
+    """
+    encontrado = _adapters.get(modelo)
+    if encontrado is None:
+        with _lock:
+            encontrado = _adapters.setdefault(modelo, TypeAdapter(modelo))
+    return encontrado
+
+
+def columnas(tabla, schema) -> list:
+    """
+    Columnas de `tabla` (un modelo ORM) con los nombres de los campos de `schema`.
+    """
+    return [getattr(tabla, campo) for campo in schema.model_fields]
+
+
+def json_bytes(modelo, datos) -> bytes:
+    lista = adapter(modelo)
+    return lista.dump_json(lista.validate_python(datos, from_attributes=True))
+
+
+def lista(schema, filas, response: Optional[Response] = None):
+    """
+    Devolver `filas` (ORM o filas proyectadas) como JSON de List[schema],
+    copiando los headers ya puestos en `response` (p.ej. X-Next-Cursor).
+    Sin FAST_JSON devuelve las filas, para el response_model del endpoint.
+    """
+    if not FAST_JSON:
+        return filas
+    headers = dict(response.headers) if response is not None else {}
+    headers.pop("content-length", None)
+    return Response(
+        json_bytes(List[schema], filas), media_type="application/json", headers=headers
+    )
@@ -1,38 +1,59 @@
-import bcrypt
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 
 from app.config import AuthenticationSettings, User
 from app.schemas import LoginSchema, RegisterSchema
-from fastapi_auth_jwt import JWTAuthBackend
-from app import schemas, models
+from app import schemas, models, crud, security, cache, render, auth, throttle
 
 from sqlalchemy.orm import Session
 from typing import List
 
-from app.dependencies import get_db
+from app.dependencies import get_db, ejecutar, Paginacion, RutaDB
 
 
 
-router = APIRouter(prefix="/usuarios", tags=["usuarios"])
+router = APIRouter(prefix="/usuarios", tags=["usuarios"], route_class=RutaDB)
 
 
 # Initialize the Authentication Backend
-auth_backend = JWTAuthBackend(
+auth_backend = auth.BackendJWT(
     authentication_config=AuthenticationSettings(),
     user_schema=User,
 )
 
-@router.post("/registro")
-async def sign_up(request_data: RegisterSchema, db: Session = Depends(get_db)):
+# --- Acceso a la DB de los endpoints async, vía dependencies.ejecutar ---
+def _buscar_existente(db: Session, username: str, email: str):
+    return db.query(models.Usuario).filter(
+        (models.Usuario.username == username) | (models.Usuario.email == email)
+    ).first()
+
 
-    existe = db.query(models.Usuario).filter(
-        (models.Usuario.username == request_data.username ) | (models.Usuario.email == request_data.email)
+def _buscar_por_username(db: Session, username: str):
+    return db.query(models.Usuario).filter(
+        models.Usuario.username == username
     ).first()
 
+
+def _guardar(db: Session, usuario: models.Usuario):
+    db.add(usuario)
+    db.commit()
+    db.refresh(usuario)
+    return usuario
+
+
+@router.post("/registro")
+async def sign_up(
+    request: Request, request_data: RegisterSchema, db: Session = Depends(get_db)
+):
+    throttle.registro.verificar(request, request_data.username)
+
+    existe = await ejecutar(
+        db, _buscar_existente, request_data.username, request_data.email
+    )
+
     if existe:
         raise HTTPException(status_code=400,  detail="Usuario o email ya existe")
     
-    pass_hasheada = bcrypt.hashpw(request_data.password.encode(), bcrypt.gensalt())
+    pass_hasheada = await security.hashear_password(request_data.password)
 
     nuevo_usuario = models.Usuario(
         email = request_data.email,
@@ -41,9 +62,7 @@ async def sign_up(request_data: RegisterSchema, db: Session = Depends(get_db)):
         rol=request_data.rol
     )
 
-    db.add(nuevo_usuario)
-    db.commit()
-    db.refresh(nuevo_usuario)
+    nuevo_usuario = await ejecutar(db, _guardar, nuevo_usuario)
 
     schema = schemas.UsuarioResponse.model_validate(nuevo_usuario)
 
@@ -51,15 +70,21 @@ async def sign_up(request_data: RegisterSchema, db: Session = Depends(get_db)):
 
 
 @router.post("/login")
-async def login(request_data: LoginSchema, db: Session = Depends(get_db)):
+async def login(
+    request: Request, request_data: LoginSchema, db: Session = Depends(get_db)
+):
+    throttle.login.verificar(request, request_data.username)
 
-    user = db.query(models.Usuario).filter(
-        models.Usuario.username == request_data.username
-    ).first()
+    user = await ejecutar(db, _buscar_por_username, request_data.username)
 
-    if not user or not bcrypt.checkpw(request_data.password.encode(), user.password):
+    if not user or not await security.verificar_password(request_data.password, user.password):
         raise HTTPException(status_code = 404, detail = "Usuario o contraseña incorrectos")
 
+    # Si cambió el costo de bcrypt, regenerar el hash con la contraseña ya validada
+    if security.necesita_rehash(user.password):
+        user.password = await security.hashear_password(request_data.password)
+        user = await ejecutar(db, _guardar, user)
+
     schema = schemas.UsuarioResponse.model_validate(user)
 
     token = await auth_backend.create_token(
@@ -90,11 +115,17 @@ async def logout(request: Request):
 #   USUARIOS
 # ==========================
 @router.get("/", response_model=List[schemas.UsuarioResponse])
-def listar_usuarios(db: Session = Depends(get_db)):
+def listar_usuarios(
+    response: Response,
+    paginacion: Paginacion = Depends(),
+    db: Session = Depends(get_db),
+):
     """
-    Obtener todos los usuarios guardados.
+    Obtener los usuarios guardados, paginados por cursor.
     """
-    return db.query(models.Usuario).all()
+    query = db.query(*render.columnas(models.Usuario, schemas.UsuarioResponse))
+    usuarios = crud.paginar(query, models.Usuario.id, paginacion, response)
+    return render.lista(schemas.UsuarioResponse, usuarios, response)
 
 
 @router.get("/{usuario_id}", response_model=schemas.UsuarioResponse)
@@ -118,9 +149,14 @@ def actualizar_usuario(
     usuario = db.query(models.Usuario).filter(models.Usuario.id == usuario_id).first()
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    cambia_rol = usuario.rol != datos.rol
     usuario.email = datos.email
     usuario.rol = datos.rol
     db.commit()
+    if cambia_rol:
+        # Los tokens emitidos con el rol anterior dejan de valer
+        auth_backend.revocar_usuario(usuario.username)
+    cache.catalogo.invalidar(f"usuario:{usuario_id}")
     db.refresh(usuario)
     return usuario
 
@@ -134,6 +170,9 @@ def eliminar_usuario(usuario_id: int, db: Session = Depends(get_db)):
     usuario = db.query(models.Usuario).filter(models.Usuario.id == usuario_id).first()
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    username = usuario.username
     db.delete(usuario)
     db.commit()
+    auth_backend.revocar_usuario(username)
+    cache.catalogo.invalidar(f"usuario:{usuario_id}")
     return {"ok": True, "mensaje": "Usuario eliminado"}
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+from datetime import datetime, date, time
 from typing import Optional, List
 
 
@@ -105,6 +105,34 @@ class TurnoResponse(BaseModel):
         orm_mode = True
 
 
+class TurnoRecurrenteCreate(BaseModel):
+    servicio_id: int
+    dias_semana: List[int] = Field(min_length=1)  # 0 = lunes ... 6 = domingo
+    horas: List[time] = Field(min_length=1)
+    fecha_desde: date
+    fecha_hasta: date  # inclusive
+    duracion_minutos: int
+    capacidad: int
+    precio: Optional[float] = None
+
+
+class TurnosGenerados(BaseModel):
+    cantidad: int
+    ids: List[int]
+
+
+class TurnoDisponible(BaseModel):
+    id: int
+    servicio_id: int
+    servicio_nombre: str
+    emprendedor_id: int
+    fecha_hora_inicio: datetime
+    duracion_minutos: int
+    capacidad: int
+    precio: Optional[float]
+    lugares_disponibles: int
+
+
 class ServicioResponse(BaseModel):
     id: int
     nombre: str
@@ -141,4 +169,55 @@ class ReservaOut(BaseModel):
     emprendedor_id: int
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class ReservaBatch(BaseModel):
+    reservas: List[ReservaCreate] = Field(min_length=1, max_length=500)
+
+
+class ReservaBatchResultado(ReservaBase):
+    ok: bool
+    status_code: int
+    reserva_id: Optional[int] = None
+    detalle: Optional[str] = None
+
+
+# ---------- Lista de espera ----------
+class EsperaCreate(BaseModel):
+    usuario_id: int
+
+
+class EsperaResponse(BaseModel):
+    id: int
+    turno_id: int
+    usuario_id: int
+    posicion: Optional[int] = None  # 1 = el próximo en recibir un lugar
+    reserva_id: Optional[int] = None  # si había un lugar libre y ya lo tomó
+
+
+# ---------- Búsqueda ----------
+class ResultadoBusqueda(BaseModel):
+    tipo: str  # emprendedor o servicio
+    id: int
+    titulo: str
+    descripcion: Optional[str] = None
+    emprendedor_id: int
+    score: float  # mayor es más relevante
+
+
+# ---------- Estadísticas ----------
+class EstadisticaPeriodo(BaseModel):
+    desde: date  # primer día del período
+    turnos: int
+    lugares: int
+    reservas: int
+    ingresos: float
+    ocupacion: float  # reservas / lugares
+
+
+class EstadisticasEmprendedor(BaseModel):
+    emprendedor_id: int
+    granularidad: str
+    periodos: List[EstadisticaPeriodo]
+    total: EstadisticaPeriodo
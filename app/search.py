@@ -0,0 +1,112 @@
+"""
+Búsqueda de texto completo sobre emprendedores y servicios con FTS5.
+
+Las tablas virtuales son de contenido externo: guardan solo el índice y
+leen el texto de emprendedores/servicios. Los triggers las mantienen al
+día con cualquier INSERT, UPDATE o DELETE, venga del ORM o de SQL directo.
+
+Reconstruir el índice de una base existente: python -m app.search
+"""
+import re
+from enum import Enum
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app import database
+
+# Términos de búsqueda aceptados en una consulta
+MAX_TERMINOS = 10
+
+# (tabla FTS, tabla de contenido, columnas indexadas)
+INDICES = [
+    ("emprendedores_fts", "emprendedores", ("negocio", "descripcion")),
+    ("servicios_fts", "servicios", ("nombre", "descripcion")),
+]
+
+
+class Tipo(str, Enum):
+    emprendedor = "emprendedor"
+    servicio = "servicio"
+
+
+def _ddl(fts: str, tabla: str, columnas) -> List[str]:
+    lista = ", ".join(columnas)
+    nuevos = ", ".join(f"new.{c}" for c in columnas)
+    viejos = ", ".join(f"old.{c}" for c in columnas)
+    borrar = f"INSERT INTO {fts}({fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos});"
+    insertar = f"INSERT INTO {fts}(rowid, {lista}) VALUES (new.id, {nuevos});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{lista}, content='{tabla}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END",
+        # Solo cuando cambia el texto, no en cada incremento de `version`
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {lista} ON {tabla} "
+        f"BEGIN {borrar} {insertar} END",
+    ]
+
+
+def crear(conn: Connection) -> None:
+    """Crear las tablas FTS y sus triggers, si no existen."""
+    for fts, tabla, columnas in INDICES:
+        for sentencia in _ddl(fts, tabla, columnas):
+            conn.execute(text(sentencia))
+
+
+def reconstruir(conn: Connection) -> None:
+    """Volver a indexar todo el contenido actual."""
+    for fts, _, _ in INDICES:
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def consulta_fts(q: str) -> Optional[str]:
+    """
+    Convertir el texto del usuario en una consulta FTS5 segura: cada palabra
+    como prefijo entre comillas, todas obligatorias. None si no hay palabras.
+    """
+    terminos = re.findall(r"\w+", q)[:MAX_TERMINOS]
+    if not terminos:
+        return None
+    return " ".join(f'"{termino}"*' for termino in terminos)
+
+
+# Primera columna (negocio / nombre) con el doble de peso que la descripción
+_EMPRENDEDORES = """
+    SELECT 'emprendedor' AS tipo, e.id, e.negocio AS titulo, e.descripcion,
+           e.id AS emprendedor_id, bm25(emprendedores_fts, 2.0, 1.0) AS rank
+    FROM emprendedores_fts JOIN emprendedores e ON e.id = emprendedores_fts.rowid
+    WHERE emprendedores_fts MATCH :q
+"""
+_SERVICIOS = """
+    SELECT 'servicio' AS tipo, s.id, s.nombre AS titulo, s.descripcion,
+           s.emprendedor_id, bm25(servicios_fts, 2.0, 1.0) AS rank
+    FROM servicios_fts JOIN servicios s ON s.id = servicios_fts.rowid
+    WHERE servicios_fts MATCH :q
+"""
+
+
+def buscar(db: Session, consulta: str, tipo: Optional[Tipo], limit: int, offset: int):
+    """
+    Resultados ordenados por relevancia (bm25; menor es mejor).
+    """
+    partes = {Tipo.emprendedor: _EMPRENDEDORES, Tipo.servicio: _SERVICIOS}
+    if tipo is not None:
+        partes = {tipo: partes[tipo]}
+    sql = (
+        " UNION ALL ".join(partes.values())
+        + " ORDER BY rank, tipo, id LIMIT :limit OFFSET :offset"
+    )
+    return db.execute(
+        text(sql), {"q": consulta, "limit": limit, "offset": offset}
+    ).all()
+
+
+if __name__ == "__main__":
+    with database.engine.begin() as conn:
+        crear(conn)
+        reconstruir(conn)
+    print("Índice de búsqueda reconstruido")
@@ -0,0 +1,48 @@
+"""
+Hasheo de contraseñas fuera del event loop.
+
+bcrypt tarda cientos de milisegundos por llamada, así que se ejecuta en
+hilos de trabajo limitados por un CapacityLimiter propio: una ráfaga de
+logins no bloquea el event loop ni ocupa todo el threadpool de FastAPI.
+"""
+import anyio
+import bcrypt
+
+from app.config import PasswordSettings
+
+settings = PasswordSettings()
+_limiter = anyio.CapacityLimiter(settings.hash_workers)
+
+
+def _como_bytes(hasheada) -> bytes:
+    return hasheada if isinstance(hasheada, bytes) else hasheada.encode()
+
+
+def _rondas(hasheada: bytes) -> int:
+    # Formato: $2b$<rondas>$<salt+hash>
+    return int(hasheada.split(b"$")[2])
+
+
+def _hashear(password: str) -> bytes:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(settings.bcrypt_rounds))
+
+
+def _verificar(password: str, hasheada) -> bool:
+    return bcrypt.checkpw(password.encode(), _como_bytes(hasheada))
+
+
+async def hashear_password(password: str) -> bytes:
+    return await anyio.to_thread.run_sync(_hashear, password, limiter=_limiter)
+
+
+async def verificar_password(password: str, hasheada) -> bool:
+    return await anyio.to_thread.run_sync(
+        _verificar, password, hasheada, limiter=_limiter
+    )
+
+
+def necesita_rehash(hasheada) -> bool:
+    """
+    Indica si el hash fue generado con un costo distinto al configurado.
+    """
+    return _rondas(_como_bytes(hasheada)) != settings.bcrypt_rounds
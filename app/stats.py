@@ -0,0 +1,177 @@
+"""
+Estadísticas de ocupación e ingresos por emprendedor.
+
+La tabla estadisticas_diarias guarda, por emprendedor y día de turno, la
+cantidad de turnos, los lugares ofrecidos, los lugares reservados y los
+ingresos (precio del turno por cada reserva). Triggers sobre turnos y
+reservas la actualizan en la misma transacción de cada cambio, venga de
+un handler, de una carga masiva o de SQL directo; el dashboard solo lee
+unas pocas filas por día.
+
+Los turnos archivados (app/archive.py) siguen contando: los triggers de
+borrado ignoran las filas que ya se copiaron al archivo.
+
+Recalcular todo desde turnos y reservas: python -m app.stats
+"""
+from datetime import date
+from enum import Enum
+
+from sqlalchemy import func, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app import database, models
+
+
+class Granularidad(str, Enum):
+    dia = "dia"
+    semana = "semana"
+    mes = "mes"
+
+
+def _sumar(signo: str, turno: str, turnos: str, reservas: str) -> str:
+    """
+    Upsert que suma (o resta, con signo "-") al día del turno `turno`
+    ("NEW" u "OLD") las cantidades dadas.
+    """
+    return f"""
+        INSERT INTO estadisticas_diarias
+            (emprendedor_id, fecha, turnos, lugares, reservas, ingresos)
+        SELECT s.emprendedor_id, date({turno}.fecha_hora_inicio),
+               {signo}({turnos}), {signo}({turnos}) * {turno}.capacidad,
+               {signo}({reservas}), {signo}({reservas}) * coalesce({turno}.precio, 0)
+        FROM servicios s WHERE s.id = {turno}.servicio_id
+        ON CONFLICT (emprendedor_id, fecha) DO UPDATE SET
+            turnos = turnos + excluded.turnos,
+            lugares = lugares + excluded.lugares,
+            reservas = reservas + excluded.reservas,
+            ingresos = ingresos + excluded.ingresos;
+    """
+
+
+def _sumar_reserva(signo: str, reserva: str) -> str:
+    """
+    Upsert que suma (o resta) una reserva al día de su turno.
+    """
+    return f"""
+        INSERT INTO estadisticas_diarias
+            (emprendedor_id, fecha, turnos, lugares, reservas, ingresos)
+        SELECT s.emprendedor_id, date(t.fecha_hora_inicio), 0, 0,
+               {signo}1, {signo}coalesce(t.precio, 0)
+        FROM turnos t JOIN servicios s ON s.id = t.servicio_id
+        WHERE t.id = {reserva}.turno_id
+        ON CONFLICT (emprendedor_id, fecha) DO UPDATE SET
+            reservas = reservas + excluded.reservas,
+            ingresos = ingresos + excluded.ingresos;
+    """
+
+
+TRIGGERS = {
+    "estadisticas_turno_ai": f"""
+        AFTER INSERT ON turnos BEGIN
+        {_sumar("+", "NEW", "1", "NEW.reservas_count")}
+        END""",
+    "estadisticas_turno_ad": f"""
+        AFTER DELETE ON turnos
+        WHEN NOT EXISTS (SELECT 1 FROM turnos_historicos WHERE id = OLD.id) BEGIN
+        {_sumar("-", "OLD", "1", "OLD.reservas_count")}
+        END""",
+    # Sacar el turno del día viejo y sumarlo en el nuevo. No se dispara con
+    # reservas_count: de eso se ocupan los triggers de reservas.
+    "estadisticas_turno_au": f"""
+        AFTER UPDATE OF servicio_id, fecha_hora_inicio, capacidad, precio ON turnos BEGIN
+        {_sumar("-", "OLD", "1", "OLD.reservas_count")}
+        {_sumar("+", "NEW", "1", "NEW.reservas_count")}
+        END""",
+    "estadisticas_reserva_ai": f"""
+        AFTER INSERT ON reservas BEGIN
+        {_sumar_reserva("+", "NEW")}
+        END""",
+    "estadisticas_reserva_ad": f"""
+        AFTER DELETE ON reservas
+        WHEN NOT EXISTS (SELECT 1 FROM reservas_historicas WHERE id = OLD.id) BEGIN
+        {_sumar_reserva("-", "OLD")}
+        END""",
+}
+
+
+def crear(conn: Connection) -> None:
+    """Crear los triggers, si no existen."""
+    for nombre, cuerpo in TRIGGERS.items():
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {nombre} {cuerpo}"))
+
+
+def reemplazar(conn: Connection) -> None:
+    """Volver a crear los triggers con la definición actual."""
+    for nombre in TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {nombre}"))
+    crear(conn)
+
+
+def backfill(conn: Connection) -> None:
+    """Recalcular la tabla completa a partir de turnos y reservas, con el archivo."""
+    conn.execute(text("DELETE FROM estadisticas_diarias"))
+    conn.execute(
+        text(
+            """
+            INSERT INTO estadisticas_diarias
+                (emprendedor_id, fecha, turnos, lugares, reservas, ingresos)
+            SELECT s.emprendedor_id, date(t.fecha_hora_inicio), count(*),
+                   sum(t.capacidad), sum(t.reservas_count),
+                   sum(t.reservas_count * coalesce(t.precio, 0))
+            FROM (
+                SELECT servicio_id, fecha_hora_inicio, capacidad, precio, reservas_count
+                FROM turnos
+                UNION ALL
+                SELECT servicio_id, fecha_hora_inicio, capacidad, precio, reservas_count
+                FROM turnos_historicos
+            ) t JOIN servicios s ON s.id = t.servicio_id
+            GROUP BY s.emprendedor_id, date(t.fecha_hora_inicio)
+            """
+        )
+    )
+
+
+def _periodo(granularidad: Granularidad):
+    fecha = models.EstadisticaDiaria.fecha
+    if granularidad == Granularidad.semana:
+        # Lunes de la semana
+        return func.date(fecha, "weekday 0", "-6 days")
+    if granularidad == Granularidad.mes:
+        return func.strftime("%Y-%m-01", fecha)
+    return func.date(fecha)
+
+
+def consultar(
+    db: Session, emprendedor_id: int, desde: date, hasta: date, granularidad: Granularidad
+):
+    """
+    Totales por período entre `desde` y `hasta` (inclusive), en orden.
+    Los períodos sin turnos no aparecen.
+    """
+    tabla = models.EstadisticaDiaria
+    periodo = _periodo(granularidad).label("periodo")
+    return (
+        db.query(
+            periodo,
+            func.sum(tabla.turnos).label("turnos"),
+            func.sum(tabla.lugares).label("lugares"),
+            func.sum(tabla.reservas).label("reservas"),
+            func.sum(tabla.ingresos).label("ingresos"),
+        )
+        .filter(
+            tabla.emprendedor_id == emprendedor_id,
+            tabla.fecha >= desde,
+            tabla.fecha <= hasta,
+        )
+        .group_by(periodo)
+        .order_by(periodo)
+        .all()
+    )
+
+
+if __name__ == "__main__":
+    with database.engine.begin() as conn:
+        reemplazar(conn)
+        backfill(conn)
+    print("Estadísticas recalculadas")
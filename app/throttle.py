@@ -0,0 +1,108 @@
+"""
+Límite de intentos de login y registro con token buckets en memoria.
+
+Cada IP y cada username tienen un bucket que se recarga a razón constante.
+Un intento consume un token de cada uno; si alguno está vacío se responde
+429 antes de tocar la DB o bcrypt. Los buckets viven en un LRU acotado:
+los menos usados se descartan, y un bucket descartado vuelve lleno, que
+es lo mismo que pasaría si nadie lo hubiera usado.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from app.config import ThrottleSettings
+
+settings = ThrottleSettings()
+
+
+class Limitador:
+    """
+    Token buckets por IP y por username para un endpoint.
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        por_ip: int,
+        por_usuario: int,
+        maxsize: int,
+        ventana: float = 60.0,
+    ):
+        self.nombre = nombre
+        # (capacidad, tokens por segundo) de cada tipo de clave
+        self._limites = {
+            "ip": (por_ip, por_ip / ventana),
+            "usuario": (por_usuario, por_usuario / ventana),
+        }
+        self.maxsize = maxsize
+        # (tipo, clave) -> [tokens, último recálculo]
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.permitidos = 0
+        self.rechazados = {"ip": 0, "usuario": 0}
+        self.evictions = 0
+
+    def verificar(self, request: Request, username: str) -> None:
+        """
+        Consumir un intento; lanza 429 con Retry-After si no quedan.
+        """
+        if not settings.enabled:
+            return
+        ip = request.client.host if request.client else "desconocida"
+        with self._lock:
+            ahora = time.monotonic()
+            for tipo, clave in (("ip", ip), ("usuario", username.lower())):
+                espera = self._consumir(tipo, clave, ahora)
+                if espera is not None:
+                    self.rechazados[tipo] += 1
+                    raise HTTPException(
+                        status_code=429,
+                        detail="Demasiados intentos, probá de nuevo más tarde",
+                        headers={"Retry-After": str(math.ceil(espera))},
+                    )
+            self.permitidos += 1
+
+    def _consumir(self, tipo: str, clave: str, ahora: float) -> Optional[float]:
+        """
+        Devuelve None si había un token, o los segundos hasta el próximo.
+        """
+        capacidad, recarga = self._limites[tipo]
+        bucket = self._buckets.get((tipo, clave))
+        if bucket is None:
+            bucket = self._buckets[(tipo, clave)] = [float(capacidad), ahora]
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end((tipo, clave))
+            bucket[0] = min(capacidad, bucket[0] + (ahora - bucket[1]) * recarga)
+            bucket[1] = ahora
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / recarga
+        bucket[0] -= 1
+        return None
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "claves": len(self._buckets),
+                "maxsize": self.maxsize,
+                "permitidos": self.permitidos,
+                "rechazados_ip": self.rechazados["ip"],
+                "rechazados_usuario": self.rechazados["usuario"],
+                "evictions": self.evictions,
+            }
+
+
+login = Limitador(
+    "login", settings.login_por_ip, settings.login_por_usuario, settings.maxsize
+)
+registro = Limitador(
+    "registro", settings.registro_por_ip, settings.registro_por_usuario, settings.maxsize
+)
+limitadores = (login, registro)
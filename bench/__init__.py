@@ -0,0 +1,8 @@
+"""
+Benchmarks de la API: generador de datos sintéticos y escenarios de carga.
+
+    python -m bench.seed --usuarios 1000 --turnos 100
+    python -m bench.run --escenario mixto --salida resultado.json
+
+Ambos usan la base de DATABASE_URL (por defecto ./basedatos.db).
+"""
@@ -0,0 +1,141 @@
+"""
+Cantidad de queries por request de los endpoints con relaciones anidadas.
+
+Cada endpoint tiene que correr un número fijo de queries, sin importar
+cuántas filas devuelve (sin N+1). Se corre contra la base de `bench.seed`,
+con la caché del catálogo vacía, y falla si algún conteo cambia. Con una
+DATABASE_URL sync, después repite el chequeo en modo async (aiosqlite).
+
+Uso: python -m bench.consultas
+"""
+import asyncio
+import os
+import subprocess
+import sys
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import httpx
+from sqlalchemy import event, func, select
+
+from app import cache, database, models
+from app.dependencies import MAX_PAGE_SIZE
+from bench.run import BASE_URL, Datos, Medicion, _login
+
+# Queries esperadas por endpoint, con la caché del catálogo vacía. Incluyen
+# el chequeo de que exista el emprendedor o usuario pedido
+ESPERADAS = {
+    "/emprendedores/": 1,
+    "/emprendedores/{id}": 1,
+    "/emprendedores/{id}/servicios": 3,
+    "/usuarios/{id}/reservas": 2,
+}
+
+
+class Contador:
+    """Queries ejecutadas mientras el contador está activo."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sentencias: List[str] = []
+
+    def _antes(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+        self.sentencias.append(statement)
+
+
+@contextmanager
+def contar_queries() -> Iterator[Contador]:
+    """
+    Contar las queries de los engines de la API (sync y async) dentro del bloque.
+    """
+    contador = Contador()
+    engines = [database.engine]
+    if database.async_engine is not None:
+        engines.append(database.async_engine.sync_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", contador._antes)
+    try:
+        yield contador
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", contador._antes)
+
+
+def _con_mas_reservas() -> int:
+    with database.engine.connect() as conn:
+        return conn.execute(
+            select(models.Reserva.usuario_id)
+            .group_by(models.Reserva.usuario_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        ).scalar_one()
+
+
+def _con_mas_servicios() -> int:
+    with database.engine.connect() as conn:
+        return conn.execute(
+            select(models.Servicio.emprendedor_id)
+            .group_by(models.Servicio.emprendedor_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        ).scalar_one()
+
+
+async def verificar() -> List[str]:
+    """
+    Pedir cada endpoint y devolver los conteos que no coinciden.
+    """
+    from app.main import app
+
+    datos = Datos.cargar()
+    emprendedor_id = _con_mas_servicios()
+    usuario_id = _con_mas_reservas()
+    urls = {
+        "/emprendedores/": f"/emprendedores/?limit={MAX_PAGE_SIZE}",
+        "/emprendedores/{id}": f"/emprendedores/{emprendedor_id}",
+        "/emprendedores/{id}/servicios": f"/emprendedores/{emprendedor_id}/servicios",
+        "/usuarios/{id}/reservas": f"/usuarios/{usuario_id}/reservas",
+    }
+    fallas = []
+    transporte = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transporte, base_url=BASE_URL) as cliente:
+            cliente.headers.update(await _login(cliente, Medicion(), datos.clientes[0]))
+            for etiqueta, url in urls.items():
+                # Un request previo deja hecha la sincronización periódica de
+                # tokens revocados del middleware JWT, que no es del endpoint
+                await cliente.get(url)
+                cache.catalogo.limpiar()
+                with contar_queries() as contador:
+                    respuesta = await cliente.get(url)
+                respuesta.raise_for_status()
+                cuerpo = respuesta.json()
+                filas = len(cuerpo) if isinstance(cuerpo, list) else 1
+                print(f"{etiqueta:32} {contador.queries} queries, {filas} filas")
+                if contador.queries != ESPERADAS[etiqueta]:
+                    fallas.append(
+                        f"{etiqueta}: {contador.queries} queries, se esperaban "
+                        f"{ESPERADAS[etiqueta]}\n  " + "\n  ".join(contador.sentencias)
+                    )
+    finally:
+        if database.async_engine is not None:
+            await database.async_engine.dispose()
+    return fallas
+
+
+def _en_modo_async() -> int:
+    """Correr el mismo chequeo en otro proceso, con el driver aiosqlite."""
+    url = database.url.set(drivername="sqlite+aiosqlite")
+    entorno = {**os.environ, "DATABASE_URL": url.render_as_string(hide_password=False)}
+    return subprocess.run([sys.executable, "-m", "bench.consultas"], env=entorno).returncode
+
+
+if __name__ == "__main__":
+    print(f"Modo {'async' if database.ASYNC_MODE else 'sync'}")
+    fallas = asyncio.run(verificar())
+    if fallas:
+        sys.exit("\n".join(fallas))
+    print("OK")
+    if not database.ASYNC_MODE and database.url.get_backend_name() == "sqlite":
+        sys.exit(_en_modo_async())
@@ -0,0 +1,510 @@
+"""
+Escenarios de carga contra `app.main:app`, en proceso (httpx.ASGITransport).
+
+Cada usuario virtual se loguea con un usuario de `bench.seed` y ejecuta
+operaciones al azar según la mezcla del escenario hasta que se cumple la
+duración. El resultado (throughput y p50/p95/p99 por endpoint) se escribe
+como JSON; con --comparar se muestra la diferencia con una corrida anterior.
+
+Escenarios:
+    mixto      navegar catálogo, buscar (texto o disponibilidad), reservar,
+               cancelar y ver mis reservas
+    escritura  solo reservar y cancelar: contención de escrituras en SQLite
+    lectores   la mitad de los usuarios solo lee y la otra mitad solo reserva y
+               cancela: en WAL las lecturas no esperan a las escrituras (comparar
+               con SQLITE_JOURNAL_MODE=DELETE)
+    login      ráfaga de logins concurrentes (bcrypt fuera del event loop),
+               con la latencia de GET /turnos/ medida durante la ráfaga
+    turnos     crear una agenda de 10k turnos turno por turno vs POST
+               /turnos/recurrentes (errores del camino turno por turno contados)
+    suscriptores  memoria de miles de suscripciones en vivo ociosas y tiempo
+               de fan-out de un evento a todas (directo sobre live.hub:
+               ASGITransport no soporta WebSockets)
+
+Uso: python -m bench.run --escenario mixto --duracion 30 --salida actual.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+import httpx
+from sqlalchemy import func, select
+
+from app import database, models
+from bench.seed import PASSWORD
+
+BASE_URL = "http://bench"
+# Ventana de las búsquedas de disponibilidad
+VENTANA = timedelta(days=7)
+# Agenda del escenario "turnos": 10 horas por día, todos los días, hasta
+# completar TURNOS_AGENDA turnos
+HORAS_AGENDA = [f"{hora:02d}:00" for hora in range(9, 19)]
+TURNOS_AGENDA = 10_000
+
+
+class Medicion:
+    """Latencias y errores por endpoint."""
+
+    def __init__(self):
+        self.latencias: Dict[str, List[float]] = {}
+        self.errores: Dict[str, int] = {}
+
+    def registrar(self, etiqueta: str, segundos: float, error: bool = False) -> None:
+        self.latencias.setdefault(etiqueta, []).append(segundos)
+        if error:
+            self.errores[etiqueta] = self.errores.get(etiqueta, 0) + 1
+
+    async def pedir(
+        self, cliente: httpx.AsyncClient, metodo: str, etiqueta: str, url: str,
+        esperados=(200,), **kwargs
+    ) -> httpx.Response:
+        inicio = time.perf_counter()
+        respuesta = await cliente.request(metodo, url, **kwargs)
+        self.registrar(
+            f"{metodo} {etiqueta}",
+            time.perf_counter() - inicio,
+            respuesta.status_code not in esperados,
+        )
+        return respuesta
+
+    def resumen(self, segundos: float) -> dict:
+        endpoints = {}
+        for etiqueta, latencias in sorted(self.latencias.items()):
+            ordenadas = sorted(latencias)
+            endpoints[etiqueta] = {
+                "requests": len(ordenadas),
+                "errores": self.errores.get(etiqueta, 0),
+                "rps": round(len(ordenadas) / segundos, 2),
+                "p50_ms": _percentil(ordenadas, 50),
+                "p95_ms": _percentil(ordenadas, 95),
+                "p99_ms": _percentil(ordenadas, 99),
+                "max_ms": round(ordenadas[-1] * 1000, 2),
+            }
+        total = sum(len(latencias) for latencias in self.latencias.values())
+        return {
+            "duracion_s": round(segundos, 2),
+            "requests": total,
+            "errores": sum(self.errores.values()),
+            "throughput_rps": round(total / segundos, 2),
+            "endpoints": endpoints,
+        }
+
+
+def _percentil(ordenadas: List[float], p: int) -> float:
+    # Nearest-rank
+    indice = max(0, -(-len(ordenadas) * p // 100) - 1)
+    return round(ordenadas[indice] * 1000, 2)
+
+
+@dataclass
+class Datos:
+    """Ids de la base sembrada, leídos una vez antes de empezar."""
+
+    clientes: List[int]
+    emprendedores: List[int]
+    servicios: List[int]
+    turnos: List[int]
+    primer_turno: datetime
+    ultimo_turno: datetime
+
+    @classmethod
+    def cargar(cls) -> "Datos":
+        with database.engine.connect() as conn:
+            clientes = conn.scalars(
+                select(models.Usuario.id).where(
+                    models.Usuario.username.like("bench%"), models.Usuario.rol == "cliente"
+                )
+            ).all()
+            primero, ultimo = conn.execute(
+                select(
+                    func.min(models.Turno.fecha_hora_inicio),
+                    func.max(models.Turno.fecha_hora_inicio),
+                )
+            ).one()
+            datos = cls(
+                clientes=list(clientes),
+                emprendedores=list(conn.scalars(select(models.Emprendedor.id))),
+                servicios=list(conn.scalars(select(models.Servicio.id))),
+                turnos=list(conn.scalars(select(models.Turno.id))),
+                primer_turno=primero,
+                ultimo_turno=ultimo,
+            )
+        if not datos.clientes or not datos.turnos:
+            sys.exit("La base no tiene datos de benchmark: correr antes python -m bench.seed")
+        return datos
+
+
+@dataclass
+class Usuario:
+    id: int
+    reservas: List[int] = field(default_factory=list)
+
+
+# --- Operaciones ---
+async def _login(cliente, medicion: Medicion, usuario_id: int) -> dict:
+    respuesta = await medicion.pedir(
+        cliente, "POST", "/usuarios/login", "/usuarios/login",
+        json={"username": f"bench{usuario_id}", "password": PASSWORD},
+    )
+    respuesta.raise_for_status()
+    return {"Authorization": f"Bearer {respuesta.json()['token']}"}
+
+
+async def navegar(cliente, datos: Datos, medicion: Medicion, azar, usuario: Usuario):
+    await medicion.pedir(cliente, "GET", "/emprendedores/", "/emprendedores/?limit=20")
+    emprendedor_id = azar.choice(datos.emprendedores)
+    await medicion.pedir(
+        cliente, "GET", "/emprendedores/{id}/servicios",
+        f"/emprendedores/{emprendedor_id}/servicios",
+    )
+    await medicion.pedir(cliente, "GET", "/servicios/", "/servicios/?limit=50")
+    await medicion.pedir(
+        cliente, "GET", "/turnos/",
+        f"/turnos/?servicio_id={azar.choice(datos.servicios)}&limit=50",
+    )
+
+
+async def buscar(cliente, datos: Datos, medicion: Medicion, azar, usuario: Usuario):
+    if azar.random() < 0.5:
+        # Texto de los nombres que genera bench.seed
+        q = azar.choice(["servicio", "negocio", f"servicio {azar.randrange(100)}", "bench"])
+        await medicion.pedir(cliente, "GET", "/buscar", "/buscar", params={"q": q, "limit": 20})
+        return
+    rango = max(0, int((datos.ultimo_turno - datos.primer_turno - VENTANA).total_seconds()))
+    desde = datos.primer_turno + timedelta(seconds=azar.randint(0, rango))
+    params = {"desde": desde.isoformat(), "hasta": (desde + VENTANA).isoformat()}
+    if azar.random() < 0.5:
+        params["emprendedor_id"] = azar.choice(datos.emprendedores)
+    await medicion.pedir(cliente, "GET", "/disponibilidad", "/disponibilidad", params=params)
+
+
+async def reservar(cliente, datos: Datos, medicion: Medicion, azar, usuario: Usuario):
+    # 400 (turno lleno o ya reservado) es una respuesta esperada
+    respuesta = await medicion.pedir(
+        cliente, "POST", "/reservas/", "/reservas/", esperados=(200, 400),
+        json={"turno_id": azar.choice(datos.turnos), "usuario_id": usuario.id},
+    )
+    if respuesta.status_code == 200:
+        usuario.reservas.append(respuesta.json()["id"])
+
+
+async def cancelar(cliente, datos: Datos, medicion: Medicion, azar, usuario: Usuario):
+    if not usuario.reservas:
+        return await reservar(cliente, datos, medicion, azar, usuario)
+    reserva_id = usuario.reservas.pop(azar.randrange(len(usuario.reservas)))
+    await medicion.pedir(cliente, "DELETE", "/reservas/{id}", f"/reservas/{reserva_id}")
+
+
+async def mis_reservas(cliente, datos: Datos, medicion: Medicion, azar, usuario: Usuario):
+    await medicion.pedir(
+        cliente, "GET", "/usuarios/{id}/reservas", f"/usuarios/{usuario.id}/reservas"
+    )
+
+
+async def ver_turno(cliente, datos: Datos, medicion: Medicion, azar, usuario: Usuario):
+    await medicion.pedir(
+        cliente, "GET", "/turnos/{id}", f"/turnos/{azar.choice(datos.turnos)}"
+    )
+
+
+MEZCLAS = {
+    "mixto": {navegar: 40, buscar: 25, reservar: 15, cancelar: 5, mis_reservas: 15},
+    "escritura": {reservar: 60, cancelar: 40},
+    "lectura": {ver_turno: 50, mis_reservas: 50},
+}
+
+
+# --- Escenarios ---
+def _cliente(transporte) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=transporte, base_url=BASE_URL)
+
+
+async def _usuario_virtual(transporte, datos, medicion, mezcla, semilla, fin):
+    azar = random.Random(semilla)
+    usuario = Usuario(azar.choice(datos.clientes))
+    operaciones, pesos = list(mezcla), list(mezcla.values())
+    async with _cliente(transporte) as cliente:
+        cliente.headers.update(await _login(cliente, medicion, usuario.id))
+        while time.perf_counter() < fin:
+            operacion = azar.choices(operaciones, pesos)[0]
+            await operacion(cliente, datos, medicion, azar, usuario)
+
+
+async def _mezcla(transporte, datos, medicion, args) -> None:
+    fin = time.perf_counter() + args.duracion
+    await asyncio.gather(
+        *(
+            _usuario_virtual(
+                transporte, datos, medicion, MEZCLAS[args.escenario], args.semilla + i, fin
+            )
+            for i in range(args.concurrencia)
+        )
+    )
+
+
+async def _lectores(transporte, datos, medicion, args) -> None:
+    """
+    Lectores y escritores a la vez. Las latencias de lectura quedan en sus
+    propios endpoints; un "database is locked" aparece como error.
+    """
+    fin = time.perf_counter() + args.duracion
+    mitad = max(1, args.concurrencia // 2)
+    await asyncio.gather(
+        *(
+            _usuario_virtual(
+                transporte, datos, medicion,
+                MEZCLAS["escritura" if i < mitad else "lectura"], args.semilla + i, fin,
+            )
+            for i in range(max(2, args.concurrencia))
+        )
+    )
+
+
+async def _logins(transporte, datos, medicion, args) -> None:
+    """
+    Ráfaga de logins y, a la vez, un cliente ya logueado que lista turnos:
+    su p99 (etiqueta "durante logins") muestra si el hashing frena al resto.
+    """
+    fin = time.perf_counter() + args.duracion
+
+    async def loguear(semilla):
+        azar = random.Random(semilla)
+        async with _cliente(transporte) as cliente:
+            while time.perf_counter() < fin:
+                await _login(cliente, medicion, azar.choice(datos.clientes))
+
+    async def sondear():
+        async with _cliente(transporte) as cliente:
+            cliente.headers.update(await _login(cliente, medicion, datos.clientes[0]))
+            while time.perf_counter() < fin:
+                await medicion.pedir(
+                    cliente, "GET", "/turnos/ (durante logins)", "/turnos/?limit=20"
+                )
+
+    await asyncio.gather(
+        sondear(), *(loguear(args.semilla + i) for i in range(args.concurrencia))
+    )
+
+
+async def _turnos(transporte, datos, medicion, args) -> dict:
+    """
+    Misma agenda (TURNOS_AGENDA turnos) creada de a un turno por request y
+    con un solo POST /turnos/recurrentes, sobre fechas que no usa bench.seed.
+    """
+    async with _cliente(transporte) as cliente:
+        cliente.headers.update(await _login(cliente, medicion, datos.clientes[0]))
+        return await _agendas(cliente, datos, medicion, args)
+
+
+async def _agendas(cliente, datos, medicion, args) -> dict:
+    azar = random.Random(args.semilla)
+    fin = time.perf_counter() + args.duracion
+    dias = -(-TURNOS_AGENDA // len(HORAS_AGENDA))
+    base = {"duracion_minutos": 60, "capacidad": 5, "precio": 1000.0}
+    errores = 0
+    faltantes = 0
+    ronda = 0
+    while time.perf_counter() < fin:
+        # Cada ronda usa dos rangos de fechas nuevos, uno por cada camino
+        desde = date(2040, 1, 2) + timedelta(days=2 * ronda * dias)
+        ronda += 1
+        servicio_id = azar.choice(datos.servicios)
+
+        inicio = time.perf_counter()
+        errores_ronda = 0
+        for indice in range(TURNOS_AGENDA):
+            dia, hora = divmod(indice, len(HORAS_AGENDA))
+            fecha = desde + timedelta(days=dia)
+            respuesta = await cliente.post(
+                "/turnos/",
+                json={
+                    **base,
+                    "servicio_id": servicio_id,
+                    "fecha_hora_inicio": f"{fecha}T{HORAS_AGENDA[hora]}",
+                },
+            )
+            if not respuesta.is_success:
+                errores_ronda += 1
+        errores += errores_ronda
+        medicion.registrar(
+            "agenda turno por turno", time.perf_counter() - inicio, errores_ronda > 0
+        )
+
+        respuesta = await medicion.pedir(
+            cliente, "POST", "/turnos/recurrentes", "/turnos/recurrentes",
+            json={
+                **base,
+                "servicio_id": servicio_id,
+                "dias_semana": list(range(7)),
+                "horas": HORAS_AGENDA,
+                "fecha_desde": str(desde + timedelta(days=dias)),
+                "fecha_hasta": str(desde + timedelta(days=2 * dias - 1)),
+            },
+        )
+        if respuesta.is_success and respuesta.json()["cantidad"] != dias * len(HORAS_AGENDA):
+            faltantes += 1
+    return {
+        "turnos_por_agenda": dias * len(HORAS_AGENDA),
+        "agendas": ronda,
+        "errores_turno_por_turno": errores,
+        "recurrentes_incompletas": faltantes,
+    }
+
+
+async def _suscriptores(transporte, datos, medicion, args) -> dict:
+    """
+    Cada suscriptor es una tarea esperando eventos, como el handler del
+    WebSocket. Se mide la memoria que ocupan y cuánto tarda un evento en
+    llegar a todos.
+    """
+    from app import live
+
+    topico = f"servicio:{datos.servicios[0]}"
+    listos = asyncio.Event()
+    recibidos = 0
+
+    async def suscriptor(suscritos: asyncio.Event):
+        nonlocal recibidos
+        with live.hub.suscribir([topico]) as suscripcion:
+            suscritos.set()
+            while True:
+                await suscripcion.siguiente()
+                recibidos += 1
+                if recibidos == args.suscriptores:
+                    listos.set()
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    tareas = []
+    for _ in range(args.suscriptores):
+        suscritos = asyncio.Event()
+        tareas.append(asyncio.ensure_future(suscriptor(suscritos)))
+        await suscritos.wait()
+    memoria = tracemalloc.get_traced_memory()[0] - antes
+    tracemalloc.stop()
+
+    fin = time.perf_counter() + args.duracion
+    try:
+        while time.perf_counter() < fin:
+            recibidos = 0
+            listos.clear()
+            inicio = time.perf_counter()
+            live.hub.publicar([topico], {"evento": "lugares", "delta": -1})
+            await listos.wait()
+            medicion.registrar(f"fan-out a {args.suscriptores}", time.perf_counter() - inicio)
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+    return {
+        "suscriptores": args.suscriptores,
+        "memoria_kib": round(memoria / 1024, 1),
+        "bytes_por_suscriptor": round(memoria / args.suscriptores),
+    }
+
+
+ESCENARIOS = {
+    "mixto": _mezcla,
+    "escritura": _mezcla,
+    "lectores": _lectores,
+    "login": _logins,
+    "turnos": _turnos,
+    "suscriptores": _suscriptores,
+}
+
+
+async def correr(args) -> dict:
+    from app import throttle
+    from app.main import app
+
+    # Todos los usuarios virtuales loguean desde la misma IP
+    throttle.settings.enabled = args.con_limites
+    datos = Datos.cargar()
+    medicion = Medicion()
+    transporte = httpx.ASGITransport(app=app)
+    inicio = time.perf_counter()
+    try:
+        extra = await ESCENARIOS[args.escenario](transporte, datos, medicion, args)
+    finally:
+        # ASGITransport no corre el lifespan de la app
+        if database.async_engine is not None:
+            await database.async_engine.dispose()
+    return {
+        "escenario": args.escenario,
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "concurrencia": args.concurrencia,
+        "database_url": database.DATABASE_URL,
+        **medicion.resumen(time.perf_counter() - inicio),
+        **(extra or {}),
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def comparar(base: dict, actual: dict) -> str:
+    """
+    Tabla con la variación de rps y p95 por endpoint entre dos corridas.
+    """
+    lineas = [f"{'endpoint':40} {'rps':>18} {'p95 ms':>22}"]
+    for etiqueta, nuevo in actual["endpoints"].items():
+        viejo = base["endpoints"].get(etiqueta)
+        if viejo is None:
+            lineas.append(f"{etiqueta:40} {nuevo['rps']:>18} {nuevo['p95_ms']:>22}")
+            continue
+        lineas.append(
+            f"{etiqueta:40} "
+            f"{viejo['rps']:>8} -> {nuevo['rps']:<8}"
+            f"{viejo['p95_ms']:>10} -> {nuevo['p95_ms']:<10}"
+        )
+    return "\n".join(lineas)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Correr un escenario de carga")
+    parser.add_argument("--escenario", choices=ESCENARIOS, default="mixto")
+    parser.add_argument("--duracion", type=float, default=30, help="segundos")
+    parser.add_argument("--concurrencia", type=int, default=20, help="usuarios virtuales")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument(
+        "--suscriptores", type=int, default=5000, help="escenario suscriptores"
+    )
+    parser.add_argument(
+        "--con-limites", action="store_true", help="aplicar el límite de intentos de login"
+    )
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto stdout)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    args = parser.parse_args(argv)
+
+    resultado = asyncio.run(correr(args))
+    contenido = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(contenido + "\n")
+    else:
+        print(contenido)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            print(comparar(json.load(archivo), resultado), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
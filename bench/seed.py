@@ -0,0 +1,191 @@
+"""
+Carga datos sintéticos con inserts en bloque.
+
+Los usuarios se llaman bench<N> y comparten la contraseña PASSWORD, así
+los escenarios pueden loguearse con cualquiera de ellos. Con la misma
+semilla se generan siempre los mismos datos.
+
+Uso: python -m bench.seed --usuarios 1000 --emprendedores 100 --reservas 20000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import anyio
+from sqlalchemy import delete, func, insert, select
+
+from app import database, migrations, models, security, stats
+
+PASSWORD = "bench"
+# Filas por sentencia INSERT
+BLOQUE = 5000
+# Primer turno generado
+DESDE = datetime(2030, 1, 7, 9, 0)
+
+
+def _insertar(conn, modelo, filas) -> None:
+    for i in range(0, len(filas), BLOQUE):
+        conn.execute(insert(modelo), filas[i : i + BLOQUE])
+
+
+def _primer_id(conn, modelo) -> int:
+    return (conn.execute(select(func.max(modelo.id))).scalar() or 0) + 1
+
+
+def borrar(conn) -> None:
+    for modelo in (
+        models.Espera,
+        models.ReservaHistorica,
+        models.TurnoHistorico,
+        models.Reserva,
+        models.Turno,
+        models.Servicio,
+        models.Emprendedor,
+        models.Usuario,
+        models.EstadisticaDiaria,
+    ):
+        conn.execute(delete(modelo))
+
+
+def sembrar(
+    conn,
+    usuarios: int,
+    emprendedores: int,
+    servicios: int,
+    turnos: int,
+    reservas: int,
+    capacidad: int,
+    semilla: int,
+) -> dict:
+    """
+    Insertar los datos y devolver cuántas filas se crearon de cada tabla.
+    `servicios` es por emprendedor y `turnos` por servicio.
+    """
+    if emprendedores > usuarios:
+        raise ValueError("Cada emprendedor necesita su propio usuario")
+    azar = random.Random(semilla)
+    # bcrypt es lento: todos los usuarios comparten el mismo hash
+    hasheada = anyio.run(security.hashear_password, PASSWORD)
+
+    primer_usuario = _primer_id(conn, models.Usuario)
+    filas_usuarios = [
+        {
+            "id": primer_usuario + i,
+            "username": f"bench{primer_usuario + i}",
+            "email": f"bench{primer_usuario + i}@example.com",
+            "password": hasheada,
+            "rol": "emprendedor" if i < emprendedores else "cliente",
+        }
+        for i in range(usuarios)
+    ]
+    _insertar(conn, models.Usuario, filas_usuarios)
+
+    primer_emprendedor = _primer_id(conn, models.Emprendedor)
+    filas_emprendedores = [
+        {
+            "id": primer_emprendedor + i,
+            "usuario_id": primer_usuario + i,
+            "nombre": f"Nombre {i}",
+            "apellido": f"Apellido {i}",
+            "negocio": f"Negocio {i}",
+            "descripcion": "Emprendimiento generado para benchmarks",
+        }
+        for i in range(emprendedores)
+    ]
+    _insertar(conn, models.Emprendedor, filas_emprendedores)
+
+    primer_servicio = _primer_id(conn, models.Servicio)
+    filas_servicios = [
+        {
+            "id": primer_servicio + i,
+            "emprendedor_id": primer_emprendedor + i // servicios,
+            "nombre": f"Servicio {i}",
+            "descripcion": "Servicio generado para benchmarks",
+        }
+        for i in range(emprendedores * servicios)
+    ]
+    _insertar(conn, models.Servicio, filas_servicios)
+
+    # Turnos de hora en hora, de 9 a 18, a partir de DESDE
+    primer_turno = _primer_id(conn, models.Turno)
+    filas_turnos = []
+    for servicio in filas_servicios:
+        for j in range(turnos):
+            dia, hora = divmod(j, 10)
+            filas_turnos.append(
+                {
+                    "id": primer_turno + len(filas_turnos),
+                    "servicio_id": servicio["id"],
+                    "fecha_hora_inicio": DESDE + timedelta(days=dia, hours=hora),
+                    "duracion_minutos": 60,
+                    "capacidad": capacidad,
+                    "precio": float(azar.randrange(1000, 10000, 500)),
+                    "reservas_count": 0,
+                }
+            )
+
+    # Reservas sin duplicar (turno, usuario) ni superar la capacidad
+    filas_reservas = []
+    vistas = set()
+    intentos = 0
+    while filas_turnos and len(filas_reservas) < reservas and intentos < reservas * 10:
+        intentos += 1
+        turno = azar.choice(filas_turnos)
+        usuario_id = primer_usuario + azar.randrange(usuarios)
+        if turno["reservas_count"] >= turno["capacidad"] or (turno["id"], usuario_id) in vistas:
+            continue
+        vistas.add((turno["id"], usuario_id))
+        turno["reservas_count"] += 1
+        filas_reservas.append({"turno_id": turno["id"], "usuario_id": usuario_id})
+
+    _insertar(conn, models.Turno, filas_turnos)
+    _insertar(conn, models.Reserva, filas_reservas)
+    # Los turnos entran con reservas_count ya calculado y los triggers
+    # contarían cada reserva dos veces: se recalcula el resumen completo
+    stats.backfill(conn)
+    return {
+        "usuarios": len(filas_usuarios),
+        "emprendedores": len(filas_emprendedores),
+        "servicios": len(filas_servicios),
+        "turnos": len(filas_turnos),
+        "reservas": len(filas_reservas),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Cargar datos sintéticos para benchmarks")
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--emprendedores", type=int, default=100)
+    parser.add_argument("--servicios", type=int, default=5, help="por emprendedor")
+    parser.add_argument("--turnos", type=int, default=100, help="por servicio")
+    parser.add_argument("--reservas", type=int, default=20000)
+    parser.add_argument("--capacidad", type=int, default=5, help="lugares por turno")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--borrar", action="store_true", help="vaciar las tablas antes de cargar")
+    args = parser.parse_args(argv)
+
+    models.Base.metadata.create_all(bind=database.engine)
+    migrations.migrar(database.engine)
+
+    inicio = time.perf_counter()
+    with database.engine.begin() as conn:
+        if args.borrar:
+            borrar(conn)
+        creadas = sembrar(
+            conn,
+            args.usuarios,
+            args.emprendedores,
+            args.servicios,
+            args.turnos,
+            args.reservas,
+            args.capacidad,
+            args.semilla,
+        )
+    segundos = time.perf_counter() - inicio
+    print(", ".join(f"{cantidad} {tabla}" for tabla, cantidad in creadas.items()))
+    print(f"Cargado en {segundos:.1f} s")
+
+
+if __name__ == "__main__":
+    main()